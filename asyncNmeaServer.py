@@ -1,127 +1,313 @@
+#!/usr/bin/python3
 import asyncio
-from datetime import datetime
+import logging
 import sys
+import threading
+import time
+from config_log import traffic_log, TrafficData
+from nmea_sentence import SentenceCache
+from send_queue import SendQueue, DEFAULT_LIMIT, DEFAULT_POLICY, HAS_SENDMSG, join_buffers
+from devices import NMEADevice, FLEET
+from udp_output import UDPOutput
+from serial_output import SerialOutput
+from tick_scheduler import TickScheduler
+from capture import TX, RX
+from metrics import Metrics, key, count_sentences
+from control import NMEAControl
+from connections import ConnectionTable
 
-# Глобальные переменные
-clients = set()
-current_status = "A"
-position = (4807.38, "N", 1131.00, "E")
-
-def generate_rmc():
-    """Генерация NMEA RMC пакета"""
-    time = datetime.utcnow().strftime("%H%M%S.%f")[:10]
-    date = datetime.utcnow().strftime("%d%m%y")
-    lat, lat_dir, lon, lon_dir = position
-    #$GPRMC, 064016.000, A, 4916.45, N, 12311.12, W ,173.8,231.8,130525, 005.2, W*67 
-    
-    #$GPRMC, 064032.648, A, 4807.038, N, 1131.000, E, 0.0, 0.0, 130525, , *0012 
-    nmea = f"GPRMC,{time},{current_status},{lat:.3f},{lat_dir},{lon:.3f},{lon_dir},0.0,0.0,{date},,W"
-    checksum = calculate_checksum(nmea)
-    return f"${nmea}*{checksum}\r\n".encode()
-
-def calculate_checksum(s):
-    """Вычисление контрольной суммы NMEA"""
-    checksum = 0
-    for c in s:
-        checksum ^= ord(c)
-    return f"{checksum:02X}"
-
-async def handle_client(reader, writer):
-    """Обработка клиентского подключения"""
-    addr = writer.get_extra_info('peername')
-    print(f"Подключен новый клиент: {addr}")
-    clients.add(writer)
-    
-    try:
-        while True:
-            try:
-                data = await asyncio.wait_for(reader.read(100), timeout=1.0)
-                if not data:
-                    break
-                print(f"Получено от {addr}: {data.decode().strip()}")
-            except asyncio.TimeoutError:
-                continue
-    except Exception as e:
-        print(f"Ошибка с клиентом {addr}: {e}")
-    finally:
-        clients.discard(writer)
-        writer.close()
-        try:
-            await writer.wait_closed()
-        except Exception:
-            pass
-        print(f"Клиент {addr} отключен")
-
-async def broadcast_nmea():
-    """Регулярная рассылка данных клиентам"""
-    while True:
-        if clients:
-            packet = generate_rmc()
-            for writer in list(clients):
-                try:
-                    writer.write(packet)
-                    await writer.drain()
-                except Exception as e:
-                    print(f"Ошибка отправки: {e}")
-                    clients.discard(writer)
-        await asyncio.sleep(1)
-
-def toggle_status():
-    """Смена статуса A/V"""
-    global current_status
-    current_status = "V" if current_status == "A" else "A"
-    print(f"\nСтатус изменен на {current_status}")
-
-async def keyboard_monitor():
-    """Мониторинг клавиатуры для смены статуса"""
-    if sys.platform == "win32":
-        import msvcrt
-        while True:
-            if msvcrt.kbhit() and msvcrt.getch() == b' ':
-                toggle_status()
-            await asyncio.sleep(0.1)
-    else:
-        loop = asyncio.get_event_loop()
-        reader = asyncio.StreamReader()
-        protocol = asyncio.StreamReaderProtocol(reader)
-        await loop.connect_read_pipe(lambda: protocol, sys.stdin)
+# Общий логгер сервиса, обработчики настраивает setup_logger() в nmeaServer.py
+logger = logging.getLogger("config_log")
+
+DEFAULT_PORT = 5007
+DEFAULT_RATE = 1  # Hz
+METRICS_INTERVAL = 60  # sec
+BROADCAST_TIME = key("nmea_broadcast_seconds")
+# С Python 3.12 writelines сокетного транспорта пишет буферы через sendmsg, раньше - write(b''.join(...))
+NATIVE_WRITELINES = sys.version_info >= (3, 12) and HAS_SENDMSG
+DISCONNECTS = {reason: key("nmea_disconnects_total", reason=reason) for reason in ("closed", "error", "slow_consumer")}
+
+
+class NMEAProtocol(asyncio.Protocol):
+    """Подключение клиента NMEA в цикле событий: без потока и собственного таймера."""
+
+    # Без __dict__: на сотнях тысяч подключений состояние клиента - несколько указателей
+    __slots__ = ("_server", "_transport", "_addr", "_paused", "_reason", "queue", "device", "vessel", "conn",
+                 "faults", "slot")
+
+    def __init__(self, server, device):
+        self._server = server
+        self._transport = None
+        self._addr = None
+        self._paused = False
+        self.queue = SendQueue(server.queue_limit, server.slow_policy)
+        self.device = device
+        self.vessel = device.assign_vessel(server._fleet)
+        self.conn = server.capture.connection() if server.capture else 0
+        self.faults = server.faults.injector(server.stats) if server.faults else None
+        self._reason = None  # причина отключения, если его инициировал сервер
+        self.slot = -1  # индекс в таблице подключений сервера
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self._addr = transport.get_extra_info('peername')
+        # Пауза наступает, как только ядро не приняло данные целиком: дальше копится только своя очередь
+        transport.set_write_buffer_limits(high=0)
+        logger.info(f"Connection detected from {self._addr[0]}:{self._addr[1]} to port {self.device.port}")
+        self._server._add_client(self)
+
+    def data_received(self, data):
+        # Входящие данные от потребителей NMEA не обрабатываются, только пишутся в захват
+        if self._server.capture:
+            self._server.capture.write(self.conn, RX, data)
+
+    def connection_lost(self, exc):
+        logger.info(f"Client [{self._addr[0]}:{self._addr[1]}] connection closed ({exc or ''}), {self.queue}")
+        self._server.stats.counters[DISCONNECTS[self._reason or ("error" if exc else "closed")]] += 1
+        self._server._del_client(self)
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        self._flush()
+
+    def _flush(self):
+        while self.queue and not self._paused:
+            self._write(self.queue.get())
+
+    def _write(self, payload):
+        if NATIVE_WRITELINES:
+            self._transport.writelines(payload)
+        else:
+            # Без векторной записи - готовая склейка пакета тика, одна на всех клиентов
+            self._transport.write(join_buffers(payload))
+
+    def send(self, payload):
+        # payload - пакет тика (send_queue.Packet): writelines без склейки или его общая склейка
+        if self.faults is not None:
+            payload = self.faults.nmea(payload)
+            if not payload:
+                return
+        if self._server.capture:
+            self._server.capture.write(self.conn, TX, payload)
+        if not self._paused:
+            self._write(payload)
+            return
+        dropped = self.queue.dropped
+        if not self.queue.put(payload):
+            logger.warning(f"Client [{self._addr[0]}:{self._addr[1]}] disconnected: send queue overflow")
+            self._server.slow_disconnects += 1
+            self._reason = "slow_consumer"
+            self._transport.abort()
+        elif dropped == 0 and self.queue.dropped:
+            logger.warning(f"Client [{self._addr[0]}:{self._addr[1]}] is too slow, dropping packets ({self.queue.policy})")
+
+
+class AsyncNMEAServer(threading.Thread):
+    """Сервер NMEA на одном цикле событий asyncio.
+
+    Один таймер на все подключения: пакет формируется один раз за тик
+    и записывается в транспорты всех клиентов без блокирующего sendall.
+    Медленный клиент копит пакеты в своей ограниченной очереди и не
+    задерживает рассылку остальным.
+
+    devices - профили приемников (devices.NMEADevice): все их порты
+    обслуживаются тем же циклом и общим кэшем пакетов. Без devices
+    сервер эмулирует один приемник с параметрами port/sentences/status/id/udp/serial.
+    Пакеты приемников с адресатами UDP рассылаются тем же тиком, в
+    последовательные выводы - тем же тиком с выдачей байт таймерами цикла.
+
+    capture - capture.CaptureWriter для записи трафика всех подключений.
+    replay - capture.Replay: вместо генерации пакетов по тикам клиентам
+    рассылается записанный захват или лог NMEA.
+    metrics - metrics.Metrics процесса: цикл событий пишет в один шард.
+    faults - faults.FaultProfile: искажения потока части клиентов, остальные
+    получают общий пакет тика без изменений.
+    clock - clock.Clock: модельное время тиков вместо времени системы.
+    """
+
+    def __init__(self, host='', port=DEFAULT_PORT, clients=1024,
+                 sentences=("RMC",), status="A", id="GP", rate=DEFAULT_RATE,
+                 queue_limit=DEFAULT_LIMIT, slow_policy=DEFAULT_POLICY, fleet=None, devices=None, reuse_port=False,
+                 udp=(), udp_ttl=1, serial=(), capture=None, replay=None, metrics=None, faults=None, clock=None,
+                 *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._host = host
+        self._clients = clients
+        self._reuse_port = reuse_port
+        if devices is None:
+            devices = [NMEADevice(port, id, sentences, status, FLEET, udp, serial)]
+        self.devices = devices
+        self._udp_ttl = udp_ttl
+        self._udp_outputs = []
+        self._serial_outputs = []
+        self.queue_limit = queue_limit
+        self.slow_policy = slow_policy
+        self.slow_disconnects = 0
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.stats = self.metrics.shard()
+        self._scheduler = TickScheduler(rate, self.stats, clock)
+        self.metrics.register("nmea_clients", lambda: len(self._protocols))
+        self.metrics.register("nmea_ticks_total", lambda: self._scheduler.ticks)
+        self.metrics.register("nmea_late_ticks_total", lambda: self._scheduler.late_ticks)
+        self.metrics.register("nmea_skipped_ticks_total", lambda: self._scheduler.skipped_ticks)
+        self.control = NMEAControl(self.devices, self._scheduler, fleet)
+        self._protocols = ConnectionTable()
+        self._fleet = fleet
+        self._cache = SentenceCache(fleet)
+        self.capture = capture
+        self._replay = replay
+        self.faults = faults
+
+    def _add_client(self, protocol):
+        self._protocols.add(protocol)
+        logger.info(self._get_total_clients())
+
+    def _del_client(self, protocol):
+        self._protocols.remove(protocol)
+        logger.info(self._get_total_clients())
+
+    def _get_total_clients(self):
+        return str(self._protocols)
+
+    def _get_slow_clients(self):
+        backlogged = [protocol.queue for protocol in self._protocols if protocol.queue]
+        dropped = sum(protocol.queue.dropped for protocol in self._protocols)
+        max_backlog = max((len(queue) for queue in backlogged), default=0)
+        return (f"Slow clients: {len(backlogged)} with backlog (max {max_backlog}), "
+                f"dropped {dropped}, disconnected {self.slow_disconnects}")
+
+    def toggle_rmc_status(self):
+        # Присваивание атрибута атомарно, новый статус будет прочитан на следующем тике
+        for device in self.devices:
+            device.toggle_rmc_status()
+            logger.debug(f"New status \"{device.status}\" for RMC packet on port {device.port}")
+
+    def _broadcast(self, timestamp, real):
+        start = time.perf_counter()
+        payload = None
+        fanout = {}  # пакет -> число клиентов, счетчики обновляются один раз за тик
+        states = {}  # состояние каждого приемника читается один раз за тик
+        for protocol in self._protocols:
+            device = protocol.device
+            state = states.get(device)
+            if state is None:
+                state = states[device] = device.state
+            id, status, sentences, fix = state
+            payload = self._cache.get(timestamp, id, status, sentences, protocol.vessel, fix, real)
+            protocol.send(payload)
+            fanout[payload] = fanout.get(payload, 0) + 1
+        for sent, clients in fanout.items():
+            count_sentences(self.stats, sent, clients)
+        self.stats.observe(BROADCAST_TIME, time.perf_counter() - start)
+        if payload:
+            traffic_log.log(logging.DEBUG, "<-- TX [%d clients]: %s", len(self._protocols), TrafficData(payload))
+
+    def _send_udp(self, timestamp, real):
+        for device, vessel, output in self._udp_outputs:
+            id, status, sentences, fix = device.state
+            output.send(self._cache.get(timestamp, id, status, sentences, vessel, fix, real))
+
+    def _send_serial(self, timestamp, real):
+        for device, vessel, output in self._serial_outputs:
+            id, status, sentences, fix = device.state
+            self._write_serial(output, self._cache.get(timestamp, id, status, sentences, vessel, fix, real))
+
+    def _write_serial(self, output, payload):
+        # Таймер выдачи есть, только пока у вывода есть данные: новый пакет запускает его, если линия простаивала
+        idle = not output.busy
+        output.send(payload)
+        if idle:
+            self._pump_serial(output)
+
+    def _pump_serial(self, output):
+        delay = output.pump()
+        if delay is not None:
+            asyncio.get_running_loop().call_later(delay, self._pump_serial, output)
+
+    async def _tick_loop(self):
+        metrics_time = time.monotonic()
         while True:
-            char = await reader.read(1)
-            if char == b' ':
-                toggle_status()
+            tick = await self._scheduler.sleep_async()
+            timestamp, real = self._scheduler.timestamp(tick), self._scheduler.real(tick)
+            if self._protocols:
+                self._broadcast(timestamp, real)
+            if self._udp_outputs:
+                self._send_udp(timestamp, real)
+            if self._serial_outputs:
+                self._send_serial(timestamp, real)
+            # Интервал отчета - по реальному времени: модельное может быть ускорено или остановлено
+            if time.monotonic() - metrics_time >= METRICS_INTERVAL:
+                metrics_time = time.monotonic()
+                logger.info(self._cache)
+                logger.info(self._scheduler.report())
+                logger.info(self._get_total_clients())
+                logger.info(self._get_slow_clients())
+                if self._scheduler.clock is not None:
+                    logger.info(self._scheduler.clock)
+                for _, _, output in self._udp_outputs + self._serial_outputs:
+                    logger.info(output)
 
+    async def _replay_loop(self):
+        loop = asyncio.get_running_loop()
+        logger.info(self._replay)
+        start = loop.time()
+        for timestamp, buffers in self._replay.bursts():
+            if self._replay.speed:
+                delay = start + timestamp / self._replay.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            for protocol in self._protocols:
+                protocol.send(buffers)
+            count_sentences(self.stats, buffers, len(self._protocols))
+            for _, _, output in self._udp_outputs:
+                output.send(buffers)
+            for _, _, output in self._serial_outputs:
+                self._write_serial(output, buffers)
 
-async def cleanup():
-    """Очистка подключений"""
-    for writer in list(clients):
-        writer.close()
+    async def _listen(self, device):
+        loop = asyncio.get_running_loop()
+        logger.info(f"Starting NMEA Server on port {device.port}...")
         try:
-            await writer.wait_closed()
-        except Exception:
-            pass
-
-async def main():
-    """Основная функция"""
-    server = await asyncio.start_server(
-        handle_client,
-        '0.0.0.0',
-        8888
-    )
-    
-    print(f"Сервер NMEA запущен на tcp://0.0.0.0:8888")
-    print("Нажмите пробел для смены статуса (A/V)")
-    
-    asyncio.create_task(broadcast_nmea())
-    asyncio.create_task(keyboard_monitor())
-    
-    try:
-        async with server:
-            await server.serve_forever()
-    except KeyboardInterrupt:
-        print("\nСервер остановлен")
-    finally:
-        print("Очистка подключений...")
-        await cleanup()
+            server = await loop.create_server(lambda: NMEAProtocol(self, device), self._host, device.port,
+                                              backlog=self._clients, reuse_address=True,
+                                              reuse_port=self._reuse_port or None)
+        except OSError as e:
+            logger.error(e.strerror, exc_info=True)
+            return None
+        logger.info(f"NMEA Server started on port {device.port} {device}")
+        return server
+
+    async def serve(self):
+        servers = [server for server in [await self._listen(device) for device in self.devices] if server]
+        if not servers:
+            return
+        for device in self.devices:
+            if device.udp:
+                output = UDPOutput(device.udp, self._udp_ttl)
+                self._udp_outputs.append((device, device.assign_vessel(self._fleet), output))
+                logger.info(f"NMEA UDP output started {output}")
+            for path, baud, link in device.serial:
+                output = SerialOutput(path, baud, link)
+                self._serial_outputs.append((device, device.assign_vessel(self._fleet), output))
+                logger.info(f"NMEA serial output started {output}")
+        try:
+            await (self._replay_loop() if self._replay else self._tick_loop())
+        finally:
+            for server in servers:
+                server.close()
+            for _, _, output in self._udp_outputs + self._serial_outputs:
+                output.close()
+
+    def run(self):
+        asyncio.run(self.serve())
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # Тот же набор ключей командной строки, что и у nmeaServer.py (--engine async по умолчанию)
+    from nmeaServer import main
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from config_log import traffic_log, TrafficData
+from usv2_packet import DateTimeCache, RequestParser
+from capture import TX, RX
+from send_queue import join_buffers
+from metrics import Metrics, USV2_DISCONNECTS, count_requests
+from control import USV2Control
+from connections import ConnectionTable
+
+# Общий логгер сервиса, обработчики настраивает setup_logger() в usv2Server.py
+logger = logging.getLogger("config_log")
+
+DEFAULT_PORT = 5008
+
+
+class USV2Protocol(asyncio.Protocol):
+    """Подключение клиента УСВ2 в цикле событий: ответ на запрос без потока на клиента."""
+
+    __slots__ = ("_server", "_transport", "_addr", "_parser", "_conn", "_faults", "slot")
+
+    def __init__(self, server):
+        self._server = server
+        self._transport = None
+        self._addr = None
+        self._parser = RequestParser()
+        self._conn = server.capture.connection() if server.capture else 0
+        self._faults = server.faults.injector(server.stats) if server.faults else None
+        self.slot = -1  # индекс в таблице подключений сервера
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self._addr = transport.get_extra_info('peername')
+        logger.info(f"Connection detected from {self._addr[0]}:{self._addr[1]}")
+        self._server._add_client(self)
+
+    def data_received(self, data):
+        start = time.perf_counter()
+        traffic_log.log(logging.INFO, "%s:%s -> RX: %s", self._addr[0], self._addr[1], TrafficData(data, hex=True))
+        capture = self._server.capture
+        if capture:
+            capture.write(self._conn, RX, data)
+        stray = self._parser.stray
+        count = self._parser.feed(data)
+        if count:
+            # Ответы на все запросы пачки одной записью
+            tx = self._server.make_dt_packets(count)
+            if self._faults is not None:
+                tx = self._faults.usv2(tx)
+            if tx:  # пусто, если ответ задержан до следующего запроса
+                self._transport.write(tx)
+                if capture:
+                    capture.write(self._conn, TX, tx)
+                traffic_log.log(logging.INFO, "%s:%s <- TX: %s", self._addr[0], self._addr[1], TrafficData(tx, hex=True))
+        count_requests(self._server.stats, count, self._parser.stray - stray, start)
+
+    def connection_lost(self, exc):
+        logger.info(f"Client [{self._addr[0]}:{self._addr[1]}] connection closed ({exc or ''}), "
+                    f"stray bytes {self._parser.stray}")
+        self._server.stats.counters[USV2_DISCONNECTS["error" if exc else "closed"]] += 1
+        self._server._del_client(self)
+
+
+class AsyncUSV2Server(threading.Thread):
+    """Сервер УСВ2 на одном цикле событий asyncio.
+
+    Все подключения обслуживает один поток. Пакет даты и времени берется
+    из кэша текущей секунды (usv2_packet.DateTimeCache), поэтому ответ на
+    запрос - поиск в словаре и запись в транспорт.
+
+    capture - capture.CaptureWriter для записи трафика всех подключений.
+    replay - capture.Replay: ответы берутся из захвата, а не из часов.
+    metrics - metrics.Metrics процесса: цикл событий пишет в один шард.
+    faults - faults.FaultProfile: искажения ответов части клиентов.
+    clock - clock.Clock: модельное время ответов вместо времени системы.
+    """
+
+    def __init__(self, host='', port=DEFAULT_PORT, clients=1024, reuse_port=False, capture=None, replay=None,
+                 metrics=None, faults=None, clock=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._host = host
+        self._port = port
+        self._clients = clients
+        self._reuse_port = reuse_port
+        # Статус часов 0x00/0x80 общий для всех клиентов, в разделяемой памяти - и для всех рабочих процессов
+        self._clock = multiprocessing.RawValue('B', 0x00)
+        self.control = USV2Control(self._clock)
+        self._cache = DateTimeCache(clock)
+        self._protocols = ConnectionTable()
+        self.capture = capture
+        self._replay = replay
+        self.faults = faults
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.stats = self.metrics.shard()
+        self.metrics.register("usv2_clients", lambda: len(self._protocols))
+
+    def toggle_clock_status(self):
+        self._clock.value ^= 0x80
+        logger.info(f"New status clock 0x{self._clock.value:02X}")
+
+    def make_dt_packet(self):
+        return self._cache.get(self._clock.value)
+
+    def make_dt_packets(self, count):
+        """Ответы на count запросов пачки одним объектом bytes."""
+        if self._replay:
+            now = time.monotonic()
+            return b''.join(join_buffers(self._replay.reply(now)) for _ in range(count))
+        return self.make_dt_packet() * count
+
+    def _add_client(self, protocol):
+        self._protocols.add(protocol)
+        logger.info(self._get_total_clients())
+
+    def _del_client(self, protocol):
+        self._protocols.remove(protocol)
+        logger.info(self._get_total_clients())
+
+    def _get_total_clients(self):
+        return str(self._protocols)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        logger.info(f"Starting USV2 Server on port {self._port}...")
+        try:
+            server = await loop.create_server(lambda: USV2Protocol(self), self._host, self._port,
+                                              backlog=self._clients, reuse_address=True,
+                                              reuse_port=self._reuse_port or None)
+        except OSError as e:
+            logger.error(e.strerror, exc_info=True)
+            return
+        logger.info(f"USV2 Server started on port {self._port}")
+        if self._replay:
+            logger.info(self._replay)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+
+if __name__ == "__main__":
+    # Тот же набор ключей командной строки, что и у usv2Server.py (--engine async по умолчанию)
+    from usv2Server import main
+    main()
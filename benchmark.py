@@ -0,0 +1,669 @@
+#!/usr/bin/python3
+"""Нагрузочный тест серверов NMEA и УСВ2: сколько клиентов выдерживает один процесс.
+
+Сервер запускается в отдельном процессе, клиенты-потребители открываются
+в процессе теста на одном цикле событий. Клиентская нагрузка считается
+выдержанной, если доставлено не менее 99% пакетов и p99 отклонения
+интервала между пакетами не превышает половины периода. Кроме доставки
+и джиттера считаются сообщения и байты в секунду, задержка доставки тика
+(по времени RMC), пропущенные тики, CPU и RSS процесса сервера. Ключ
+--sentences задает набор сообщений пакета (RMC добавляется всегда: по нему
+считаются тики), например полную эпоху RMC GGA GSA GSV VTG ZDA с -i GN.
+С ключом --json результаты сохраняются в файл для сравнения между версиями.
+Ключ --faults включает искажения потока (faults.py) для доли клиентов
+--fault-clients: так сравнивается цена инжектора с чистым прогоном.
+Искаженные и задержанные RMC снижают доставку, поэтому вероятности для
+такого сравнения берутся малыми.
+
+С ключом --fanout измеряется только рассылка пакета тика (RMC+GSA) по
+парам TCP-подключений через loopback: склейка пакета для каждого клиента,
+send на каждое сообщение и код отправки движков (NMEAClient потока и
+NMEAProtocol цикла событий). Системные вызовы записи и байты, скопированные
+для них в user space, считаются на тик по фактическим вызовам send/sendmsg
+серверных сокетов.
+
+С ключом --usv2 измеряется задержка запрос→ответ сервера УСВ2: каждый
+клиент в цикле отправляет запрос и ждет пакет даты и времени.
+
+С ключом --startup измеряется холодный старт: скрипт сервиса запускается
+как демон (stdin не терминал, отдельный рабочий каталог) --runs раз, для
+каждого запуска - время до первого принятого подключения и RSS процесса
+в этот момент.
+
+С ключом --idle измеряется память сервера на подключение: открывается
+--clients подключений, которые только принимают данные (NMEA) или молчат
+(УСВ2), и прирост RSS процесса сервера делится на их число. Память сокетов
+ядра в RSS не входит. Подключения идут с разных адресов 127.0.0.x, чтобы
+не упереться в диапазон эфемерных портов одного адреса; лимит открытых
+файлов процессов теста поднимается до жесткого.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from usv2_packet import REQUEST, PACKET_SIZE
+from nmea_sentence import SENTENCES, SentenceCache, select_sentences
+from faults import FaultProfile, parse_nmea_faults, parse_fraction
+from connections import raise_file_limit
+from devices import NMEADevice
+from metrics import Metrics
+from tick_scheduler import TickScheduler
+
+DEFAULT_PORT = 5107
+STARTUP_TIMEOUT = 10  # sec
+STARTUP_POLL = 0.001  # sec, период попыток подключения к запускаемому серверу
+CONNECT_BATCH = 200
+USV2_GRACE = 5  # sec
+IDLE_SETTLE = 2  # sec, интервал замеров RSS после подключения всех клиентов
+IDLE_SETTLE_MAX = 30  # замеров
+PORTS_PER_ADDRESS = 20000  # подключений с одного адреса 127.0.0.x, меньше диапазона эфемерных портов
+
+
+def _quiet_logger():
+    # Трассировка TX на тысячах клиентов исказит результат замера
+    logging.getLogger("config_log").setLevel(logging.WARNING)
+
+
+def _run_server(engine, port, rate, sentences, id, faults=None, fault_clients=1.0):
+    # Постоянное зерно: прогоны с искажениями сравнимы между собой
+    faults = FaultProfile(faults, 0, fault_clients) if faults else None
+    if engine == "async":
+        from asyncNmeaServer import AsyncNMEAServer
+        _quiet_logger()
+        AsyncNMEAServer(port=port, rate=rate, sentences=sentences, id=id, faults=faults).run()
+    else:
+        import nmeaServer
+        _quiet_logger()
+        nmeaServer.NMEAServer(port=port, clients=1024, rate=rate, sentences=sentences, id=id, faults=faults).run()
+
+
+def _process_stats(pid):
+    """CPU-время (сек) и RSS (МБ) процесса из /proc; (None, None) без /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:')) / 1024
+        return cpu, rss
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None, None
+
+
+def _server_usage(pid, cpu_before, duration):
+    cpu, rss = _process_stats(pid)
+    if cpu is None or cpu_before is None:
+        return {"server_cpu_percent": None, "server_rss_mb": None}
+    return {"server_cpu_percent": (cpu - cpu_before) / duration * 100, "server_rss_mb": rss}
+
+
+def _run_usv2_server(engine, port):
+    import usv2Server
+    _quiet_logger()
+    server, _ = usv2Server.create_server(usv2Server.create_parser().parse_args(['--engine', engine,
+                                                                              '--port', str(port)]))
+    server.run()
+
+
+async def _poll(reader, writer, deadline, latencies, pipeline):
+    try:
+        while True:
+            start = time.perf_counter()
+            if start >= deadline:
+                break
+            # pipeline запросов одной записью, ответ на каждый обязателен
+            writer.write(REQUEST * pipeline)
+            await reader.readexactly(PACKET_SIZE * pipeline)
+            latencies.extend([time.perf_counter() - start] * pipeline)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        return False
+    finally:
+        writer.close()
+    return True
+
+
+async def _measure_usv2(pid, port, clients, duration, pipeline):
+    connections = []
+    for start in range(0, clients, CONNECT_BATCH):
+        batch = [asyncio.open_connection('127.0.0.1', port) for _ in range(min(CONNECT_BATCH, clients - start))]
+        connections.extend(await asyncio.gather(*batch))
+    cpu_before, _ = _process_stats(pid)
+    latencies = []
+    deadline = time.perf_counter() + duration
+    polls = [asyncio.create_task(_poll(reader, writer, deadline, latencies, pipeline)) for reader, writer in connections]
+    # Клиент, чье подключение сервер так и не принял, считается неудачным
+    done, pending = await asyncio.wait(polls, timeout=duration + USV2_GRACE)
+    for poll in pending:
+        poll.cancel()
+    usage = _server_usage(pid, cpu_before, duration)
+    return latencies, len(pending) + sum(not poll.result() for poll in done), usage
+
+
+def run_usv2_step(engine, port, clients, duration, pipeline=1):
+    """Задержка ответа сервера УСВ2 при clients одновременно опрашивающих клиентах."""
+    server = multiprocessing.Process(target=_run_usv2_server, args=(engine, port), daemon=True)
+    server.start()
+    time.sleep(1)
+    try:
+        latencies, failed, usage = asyncio.run(_measure_usv2(server.pid, port, clients, duration, pipeline))
+    finally:
+        server.terminate()
+        server.join()
+    return {
+        "engine": engine,
+        "clients": clients,
+        "pipeline": pipeline,
+        "failed": failed,
+        "requests_per_sec": len(latencies) / duration,
+        "bytes_per_sec": len(latencies) * PACKET_SIZE / duration,
+        "latency_p50_ms": _percentile(latencies, 0.5) * 1000,
+        "latency_p99_ms": _percentile(latencies, 0.99) * 1000,
+        **usage,
+    }
+
+
+def _rmc_seconds(field):
+    # b"hhmmss.sss" -> секунды от начала суток UTC
+    try:
+        return int(field[:2]) * 3600 + int(field[2:4]) * 60 + float(field[4:10])
+    except ValueError:
+        return None
+
+
+class _Consumer(asyncio.Protocol):
+    def __init__(self, interval):
+        self.interval = interval
+        self.reset()
+
+    def data_received(self, data):
+        now = time.perf_counter()
+        wall = time.time() % 86400
+        self.lines += data.count(b'\n')
+        self.bytes += len(data)
+        pos = data.find(b'RMC,')
+        if pos >= 0:
+            # Интервал между пакетами - по приходу начала тика: большой пакет может прийти несколькими сегментами
+            if self.last is not None:
+                self.gaps.append(now - self.last)
+            self.last = now
+        while pos >= 0:
+            self.ticks += 1
+            tick = _rmc_seconds(data[pos + 4:pos + 14])
+            if tick is not None:
+                # Время RMC - граница тика, задержка доставки отсчитывается от нее
+                self.latencies.append((wall - tick + 43200) % 86400 - 43200)
+                if self.tick is not None:
+                    self.dropped += max(round((tick - self.tick) % 86400 / self.interval) - 1, 0)
+                self.tick = tick
+            pos = data.find(b'RMC,', pos + 4)
+
+    def reset(self):
+        self.lines = 0
+        self.ticks = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.last = None
+        self.tick = None
+        self.gaps = []
+        self.latencies = []
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+async def _measure(pid, port, clients, rate, duration):
+    loop = asyncio.get_running_loop()
+    consumers = []
+    for start in range(0, clients, CONNECT_BATCH):
+        batch = [loop.create_connection(lambda: _Consumer(1 / rate), '127.0.0.1', port)
+                 for _ in range(min(CONNECT_BATCH, clients - start))]
+        for transport, consumer in await asyncio.gather(*batch):
+            consumers.append((transport, consumer))
+    # Прогрев: все клиенты должны получить хотя бы пару тиков
+    await asyncio.sleep(2 / rate + 1)
+    for _, consumer in consumers:
+        consumer.reset()
+    cpu_before, _ = _process_stats(pid)
+    await asyncio.sleep(duration)
+    usage = _server_usage(pid, cpu_before, duration)
+    received = sum(consumer.ticks for _, consumer in consumers)
+    interval = 1 / rate
+    jitter = [abs(gap - interval) for _, consumer in consumers for gap in consumer.gaps]
+    latencies = [latency for _, consumer in consumers for latency in consumer.latencies]
+    for transport, _ in consumers:
+        transport.close()
+    return {
+        "clients": clients,
+        "rate": rate,
+        "delivery": received / (clients * duration * rate),
+        "sentences_per_sec": sum(consumer.lines for _, consumer in consumers) / duration,
+        "bytes_per_sec": sum(consumer.bytes for _, consumer in consumers) / duration,
+        "latency_p50_ms": _percentile(latencies, 0.5) * 1000,
+        "latency_p99_ms": _percentile(latencies, 0.99) * 1000,
+        "jitter_p99_ms": _percentile(jitter, 0.99) * 1000,
+        "dropped_ticks": sum(consumer.dropped for _, consumer in consumers),
+        **usage,
+    }
+
+
+def run_step(engine, port, clients, rate, duration, sentences=("RMC",), id="GP", faults=None, fault_clients=1.0):
+    server = multiprocessing.Process(target=_run_server, args=(engine, port, rate, sentences, id, faults, fault_clients),
+                                     daemon=True)
+    server.start()
+    time.sleep(1)
+    try:
+        result = asyncio.run(_measure(server.pid, port, clients, rate, duration))
+    finally:
+        server.terminate()
+        server.join()
+    result["engine"] = engine
+    result["sustained"] = result["delivery"] >= 0.99 and result["jitter_p99_ms"] <= 500 / rate
+    return result
+
+
+def _first_accept(port, deadline):
+    """Момент perf_counter первого принятого подключения к порту или None по истечении deadline."""
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=STARTUP_TIMEOUT).close()
+            return time.perf_counter()
+        except OSError:
+            time.sleep(STARTUP_POLL)
+    return None
+
+
+def _service_command(service, engine, port):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{service}Server.py")
+    command = [sys.executable, script, '--port', str(port), '--engine', engine]
+    if service == "nmea":
+        command.append('--rmc')
+    return command
+
+
+def run_startup(service, engine, port, runs):
+    """Холодный старт сервиса: время до первого принятого подключения и RSS после старта."""
+    command = _service_command(service, engine, port)
+    times, rss = [], []
+    with tempfile.TemporaryDirectory() as workdir:  # лог сервиса не попадает в рабочий каталог теста
+        for _ in range(runs):
+            start = time.perf_counter()
+            server = subprocess.Popen(command, cwd=workdir, stdin=subprocess.DEVNULL,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                accepted = _first_accept(port, start + STARTUP_TIMEOUT)
+                if accepted is not None:
+                    times.append(accepted - start)
+                    rss.append(_process_stats(server.pid)[1])
+            finally:
+                server.terminate()
+                server.wait()
+    rss = [value for value in rss if value is not None]
+    return {
+        "service": service,
+        "engine": engine,
+        "runs": runs,
+        "failed": runs - len(times),
+        "startup_p50_ms": _percentile(times, 0.5) * 1000,
+        "startup_max_ms": max(times, default=0.0) * 1000,
+        "rss_mb": _percentile(rss, 0.5) if rss else None,
+    }
+
+
+class _Sink(asyncio.Protocol):
+    """Простаивающий потребитель: данные сервера читаются и отбрасываются."""
+
+    def data_received(self, data):
+        pass
+
+
+async def _measure_idle(pid, port, clients):
+    loop = asyncio.get_running_loop()
+    _, rss_before = _process_stats(pid)
+    transports = []
+    failed = 0
+    for start in range(0, clients, CONNECT_BATCH):
+        address = f"127.0.0.{2 + start // PORTS_PER_ADDRESS}"
+        batch = [loop.create_connection(_Sink, '127.0.0.1', port, local_addr=(address, 0))
+                 for _ in range(min(CONNECT_BATCH, clients - start))]
+        for result in await asyncio.gather(*batch, return_exceptions=True):
+            if isinstance(result, BaseException):
+                failed += 1
+            else:
+                transports.append(result[0])
+    # Сервер с потоком на клиента принимает подключения дольше, чем ядро их устанавливает:
+    # замер - когда RSS перестал расти
+    rss_after = rss_before
+    for _ in range(IDLE_SETTLE_MAX):
+        await asyncio.sleep(IDLE_SETTLE)
+        _, rss = _process_stats(pid)
+        if rss is None or rss_after is None or rss <= rss_after:
+            break
+        rss_after = rss
+    for transport in transports:
+        transport.close()
+    return rss_before, rss_after, failed
+
+
+def run_idle_step(service, engine, port, clients):
+    """Прирост RSS сервера на одно простаивающее подключение при clients подключениях."""
+    # Сервис запускается скриптом, а не fork теста: куча теста с прошлых шагов исказила бы RSS
+    command = _service_command(service, engine, port)
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen(command, cwd=workdir, stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if _first_accept(port, time.perf_counter() + STARTUP_TIMEOUT) is None:
+                raise RuntimeError(f"{service} server did not start on port {port}")
+            rss_before, rss_after, failed = asyncio.run(_measure_idle(server.pid, port, clients))
+        finally:
+            server.terminate()
+            server.wait()
+    connected = clients - failed
+    per_connection = None
+    if rss_before is not None and rss_after is not None and connected:
+        per_connection = (rss_after - rss_before) * 1024 * 1024 / connected
+    return {
+        "service": service,
+        "engine": engine,
+        "clients": clients,
+        "failed": failed,
+        "rss_before_mb": rss_before,
+        "rss_after_mb": rss_after,
+        "bytes_per_connection": per_connection,
+    }
+
+
+class _CountingSocket(socket.socket):
+    """Серверный сокет замера --fanout: считает вызовы записи и байты, скопированные для них в user space.
+
+    Копией считается переданный в вызов буфер, который не является
+    сообщением пакета тика или его общей склейкой Packet.joined (она
+    считается отдельно, один раз на тик): такой буфер собран для этого вызова.
+    """
+
+    packet = ()
+    shared = frozenset()
+    calls = 0
+    copied = 0
+
+    @classmethod
+    def start_tick(cls, packet):
+        cls.packet = packet
+        cls.shared = frozenset(id(buffer) for buffer in packet)
+
+    def _count(self, buffers):
+        cls = _CountingSocket
+        cls.calls += 1
+        joined = vars(cls.packet).get("joined")
+        for buffer in buffers:
+            data = buffer.obj if isinstance(buffer, memoryview) else buffer
+            if id(data) not in cls.shared and data is not joined:
+                cls.copied += len(buffer)
+
+    def send(self, data, *args):
+        self._count((data,))
+        return super().send(data, *args)
+
+    def sendmsg(self, buffers, *args):
+        buffers = list(buffers)
+        self._count(buffers)
+        return super().sendmsg(buffers, *args)
+
+
+def _fanout_pairs(clients):
+    """Пары TCP-подключений через loopback: серверная сторона - _CountingSocket."""
+    with socket.create_server(("127.0.0.1", 0), backlog=clients) as listener:
+        pairs = []
+        for _ in range(clients):
+            peer = socket.create_connection(listener.getsockname())
+            conn, _ = listener.accept()
+            pairs.append((_CountingSocket(fileno=conn.detach()), peer))
+    return pairs
+
+
+def _fanout_join(socks, device):
+    """Склейка пакета для каждого клиента и send - запись до векторной отправки."""
+    cache = SentenceCache()
+
+    def broadcast(tick):
+        id, status, sentences, fix = device.state
+        payload = cache.get(tick[2], id, status, sentences, None, fix, tick[0] / tick[1])
+        for sock in socks:
+            sock.send(b''.join(payload))
+    return cache, broadcast, lambda: None
+
+
+def _fanout_send(socks, device):
+    """send на каждое сообщение пакета: без копий, но вызов на сообщение."""
+    cache = SentenceCache()
+
+    def broadcast(tick):
+        id, status, sentences, fix = device.state
+        payload = cache.get(tick[2], id, status, sentences, None, fix, tick[0] / tick[1])
+        for sock in socks:
+            for buffer in payload:
+                sock.send(buffer)
+    return cache, broadcast, lambda: None
+
+
+def _fanout_thread(socks, device):
+    """Движок thread: NMEAClient._send_nmea_sentences каждого клиента, потоки не запускаются."""
+    from nmeaServer import NMEAClient
+    scheduler = TickScheduler()
+    metrics = Metrics()
+    clients = [NMEAClient(sock, sock.getpeername(), device, scheduler, metrics=metrics) for sock in socks]
+
+    def broadcast(tick):
+        for client in clients:
+            client._send_nmea_sentences(tick)
+
+    def close():
+        for client in clients:
+            NMEAClient._del_client(client)
+    return NMEAClient._cache, broadcast, close
+
+
+def _fanout_async(socks, device):
+    """Движок async: AsyncNMEAServer._broadcast по транспортам NMEAProtocol цикла событий."""
+    from asyncNmeaServer import AsyncNMEAServer, NMEAProtocol
+    loop = asyncio.new_event_loop()
+    server = AsyncNMEAServer(devices=[device])
+    for sock in socks:
+        loop.run_until_complete(loop.connect_accepted_socket(lambda: NMEAProtocol(server, device), sock))
+
+    def broadcast(tick):
+        server._broadcast(tick[2], tick[0] / tick[1])
+        loop.run_until_complete(asyncio.sleep(0))
+
+    def close():
+        for protocol in list(server._protocols):
+            protocol._transport.abort()
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+    return server._cache, broadcast, close
+
+
+FANOUT_MODES = {"join": _fanout_join, "send": _fanout_send, "thread": _fanout_thread, "async": _fanout_async}
+
+
+def run_fanout(clients, ticks=200):
+    """Стоимость рассылки одного тика clients клиентам: исходные способы записи и код движков.
+
+    Пакет тика строится в кэше режима до замера, так что время, вызовы и
+    копии относятся только к рассылке.
+    """
+    _quiet_logger()
+    device = NMEADevice(0, sentences=("RMC", "GSA"))
+    results = []
+    for mode, setup in FANOUT_MODES.items():
+        pairs = _fanout_pairs(clients)
+        cache, broadcast, close = setup([sock for sock, _ in pairs], device)
+        try:
+            _CountingSocket.calls = _CountingSocket.copied = 0
+            elapsed = 0.0
+            first = int(time.time())
+            for number in range(first, first + ticks):
+                tick = (number, 1, float(number))
+                id, status, sentences, fix = device.state
+                packet = cache.get(tick[2], id, status, sentences, None, fix, float(number))
+                _CountingSocket.start_tick(packet)
+                start = time.perf_counter()
+                broadcast(tick)
+                elapsed += time.perf_counter() - start
+                if "joined" in vars(packet):
+                    _CountingSocket.copied += len(packet.joined)  # склейка одна на всех клиентов
+                for _, peer in pairs:
+                    peer.recv(65536)
+            results.append({
+                "mode": mode,
+                "clients": clients,
+                "python": platform.python_version(),
+                "syscalls_per_tick": _CountingSocket.calls / ticks,
+                "copied_bytes_per_tick": _CountingSocket.copied / ticks,
+                "us_per_tick": elapsed / ticks * 1e6,
+            })
+        finally:
+            close()
+            for sock, peer in pairs:
+                sock.close()
+                peer.close()
+    return results
+
+
+def _version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_results(path, args, results):
+    """Результаты с описанием прогона в JSON: версия кода, интерпретатор, платформа, параметры."""
+    report = {
+        "version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "args": {key: value for key, value in vars(args).items() if key != "json"},
+        "results": results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+
+def _format_usage(result):
+    if result["server_cpu_percent"] is None:
+        return ""
+    return f", server CPU {result['server_cpu_percent']:.0f}% RSS {result['server_rss_mb']:.0f} MB"
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="NMEA and USV2 server benchmark")
+    parser.add_argument('-e', '--engine', choices=["async", "thread"], nargs='+', default=["async"],
+                        help='Server engines under test')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help='Port for the server under test')
+    parser.add_argument('-R', '--rates', type=float, nargs='+', default=[1, 10], help='Update rates, Hz')
+    parser.add_argument('-c', '--clients', type=int, nargs='+', default=[100, 500, 1000, 2000, 4000],
+                        help='Client counts to step through')
+    parser.add_argument('-d', '--duration', type=float, default=10, help='Measurement window per step, sec')
+    parser.add_argument('-s', '--sentences', nargs='+', choices=SENTENCES, default=["RMC"],
+                        help='NMEA sentences in every tick (RMC is always included)')
+    parser.add_argument('-i', '--id', choices=["GP", "GN", "GL", "BD", "GA"], default="GP",
+                        help='Talker ID, GN for all constellations')
+    parser.add_argument('--faults', type=parse_nmea_faults,
+                        help='Inject NMEA faults, e.g. checksum=0.01,split=0.01 (see nmeaServer.py --faults)')
+    parser.add_argument('--fault-clients', type=parse_fraction, default=1.0,
+                        help='Fraction of clients that receive faults')
+    parser.add_argument('--fanout', action='store_true',
+                        help='Measure only the per-tick write fan-out (syscalls and bytes copied) for each client count')
+    parser.add_argument('--usv2', action='store_true',
+                        help='Measure USV2 server request-response latency for each client count')
+    parser.add_argument('--pipeline', type=int, default=1,
+                        help='USV2 requests each client sends in one write before reading the replies')
+    parser.add_argument('--startup', action='store_true',
+                        help='Measure cold start of both services: time to the first accepted connection and RSS')
+    parser.add_argument('--runs', type=int, default=10, help='Service starts per engine for --startup')
+    parser.add_argument('--idle', action='store_true',
+                        help='Measure server memory per idle connection of both services for each client count')
+    parser.add_argument('--json', help='Save results to a JSON file')
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    results = []
+    if args.startup:
+        for service in ("nmea", "usv2"):
+            for engine in args.engine:
+                result = run_startup(service, engine, args.port, args.runs)
+                results.append(result)
+                rss = f", RSS {result['rss_mb']:.0f} MB" if result["rss_mb"] is not None else ""
+                print(f"{service:>5} {engine:>6}: first accepted connection p50 {result['startup_p50_ms']:.0f} ms, "
+                      f"max {result['startup_max_ms']:.0f} ms{rss}"
+                      f"{', failed ' + str(result['failed']) if result['failed'] else ''}")
+    elif args.idle:
+        raise_file_limit()
+        for service in ("nmea", "usv2"):
+            for engine in args.engine:
+                for clients in args.clients:
+                    result = run_idle_step(service, engine, args.port, clients)
+                    results.append(result)
+                    memory = ""
+                    if result["bytes_per_connection"] is not None:
+                        memory = (f": RSS {result['rss_before_mb']:.0f} -> {result['rss_after_mb']:.0f} MB, "
+                                  f"{result['bytes_per_connection']:.0f} bytes per connection")
+                    print(f"{service:>5} {engine:>6} {clients:>6} idle clients{memory}"
+                          f"{', failed ' + str(result['failed']) if result['failed'] else ''}")
+    elif args.fanout:
+        raise_file_limit()
+        for clients in args.clients:
+            for result in run_fanout(clients):
+                results.append(result)
+                print(f"{result['mode']:>8} {clients:>6} clients: {result['syscalls_per_tick']:>7.0f} syscalls, "
+                      f"{result['copied_bytes_per_tick']:>8.0f} bytes copied, {result['us_per_tick']:>8.0f} us per tick")
+    elif args.usv2:
+        for engine in args.engine:
+            for clients in args.clients:
+                result = run_usv2_step(engine, args.port, clients, args.duration, args.pipeline)
+                results.append(result)
+                print(f"{result['engine']:>6} USV2 {clients:>6} clients: {result['requests_per_sec']:>8.0f} req/s, "
+                      f"latency p50 {result['latency_p50_ms']:.2f} ms, p99 {result['latency_p99_ms']:.2f} ms"
+                      f"{', failed ' + str(result['failed']) if result['failed'] else ''}{_format_usage(result)}")
+    else:
+        for engine in args.engine:
+            for rate in args.rates:
+                sustained = 0
+                for clients in args.clients:
+                    result = run_step(engine, args.port, clients, rate, args.duration,
+                                      select_sentences(args.sentences + ["RMC"]), args.id,
+                                      args.faults, args.fault_clients)
+                    results.append(result)
+                    print(f"{engine:>6} {rate:>5g} Hz {clients:>6} clients: "
+                          f"delivery {result['delivery']:.3f}, {result['sentences_per_sec']:.0f} sentences/s, "
+                          f"latency p99 {result['latency_p99_ms']:.1f} ms, jitter p99 {result['jitter_p99_ms']:.1f} ms, "
+                          f"dropped {result['dropped_ticks']}{_format_usage(result)}"
+                          f"{'' if result['sustained'] else '  <- overloaded'}")
+                    if not result["sustained"]:
+                        break
+                    sustained = clients
+                print(f"{engine} engine sustains {sustained} clients at {rate:g} Hz")
+    if args.json:
+        save_results(args.json, args, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import atexit
+import itertools
+import mmap
+import struct
+import threading
+import time
+from send_queue import Packet
+
+MAGIC = b'NMEACAP1'
+RECORD = struct.Struct('<dIBI')  # время UTC, ID подключения, направление, длина данных
+TX = 0
+RX = 1
+WRITE_BUFFER = 1 << 20  # байт
+FLUSH_INTERVAL = 1.0  # sec
+LOOP_GAP = 1.0  # sec, пауза между концом и началом захвата при повторе
+RELEASE_WINDOW = 64 << 20  # байт прочитанного захвата, после которых страницы отдаются ядру
+MAX_BURST = 256  # записей в пачке, лог без времени не собирается в одну пачку
+HAS_MADVISE = hasattr(mmap.mmap, "madvise") and hasattr(mmap, "MADV_DONTNEED")
+# Сообщения NMEA с временем UTC hhmmss.ss в первом поле
+TIME_SENTENCES = (b'RMC', b'GGA', b'GNS', b'ZDA', b'GBS', b'GST')
+
+
+class CaptureWriter:
+    """Запись трафика эмулятора в двоичный файл захвата.
+
+    Файл - заголовок MAGIC и записи RECORD с сырыми байтами: время,
+    ID подключения, направление TX/RX. Запись буферизована и
+    сбрасывается на диск не реже раза в FLUSH_INTERVAL.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._file = open(path, 'wb', buffering=WRITE_BUFFER)
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._flushed = time.time()
+        atexit.register(self.close)
+
+    def connection(self):
+        """ID нового подключения в захвате."""
+        return next(self._ids)
+
+    def write(self, conn, direction, data):
+        """Запись пакета: data - bytes или кортеж буферов (nmea_sentence.make_nmea_buffers)."""
+        if not isinstance(data, tuple):
+            data = (data,)
+        now = time.time()
+        header = RECORD.pack(now, conn, direction, sum(len(buffer) for buffer in data))
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(header)
+            for buffer in data:
+                self._file.write(buffer)
+            self.records += 1
+            if now - self._flushed >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed = now
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __str__(self):
+        return f"Capture {self.path}: {self.records} records"
+
+
+def parse_speed(value):
+    """Тип аргумента --replay-speed для argparse: ускорение воспроизведения, 0 - максимальная скорость."""
+    try:
+        speed = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid replay speed: {value}")
+    if speed < 0:
+        raise argparse.ArgumentTypeError("replay speed must be >= 0")
+    return speed
+
+
+def _sentence_time(line):
+    # "$GPRMC,123519.00,..." -> секунды от начала суток
+    fields = line.split(b',', 2)
+    if len(fields) < 3 or fields[0][-3:] not in TIME_SENTENCES or len(fields[1]) < 6:
+        return None
+    try:
+        return int(fields[1][:2]) * 3600 + int(fields[1][2:4]) * 60 + float(fields[1][4:])
+    except ValueError:
+        return None
+
+
+class CaptureReader:
+    """Чтение захвата через mmap: файл любого размера не загружается в память.
+
+    Кроме двоичного захвата читается текстовый лог NMEA: каждая строка -
+    запись TX подключения 0, время берется из сообщений с полем времени
+    (RMC, GGA, ZDA, ...), строки без него получают время предыдущей
+    (до первого такого сообщения - None).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path}: capture is empty")
+        self.binary = self._map[:len(MAGIC)] == MAGIC
+        if HAS_MADVISE:
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def _release(self, released, pos):
+        # Прочитанные страницы не копятся в RSS: при повторном обращении они снова читаются из файла
+        if not HAS_MADVISE or pos - released < RELEASE_WINDOW:
+            return released
+        length = (pos - released) // mmap.PAGESIZE * mmap.PAGESIZE
+        self._map.madvise(mmap.MADV_DONTNEED, released, length)
+        return released + length
+
+    def __iter__(self):
+        """Записи (время, ID подключения, направление, данные)."""
+        return self._records() if self.binary else self._lines()
+
+    def _records(self):
+        view = memoryview(self._map)
+        pos = len(MAGIC)
+        end = len(view)
+        released = 0
+        while pos + RECORD.size <= end:
+            released = self._release(released, pos)
+            timestamp, conn, direction, size = RECORD.unpack_from(view, pos)
+            pos += RECORD.size
+            if pos + size > end:
+                break  # оборванная последняя запись
+            yield timestamp, conn, direction, view[pos:pos + size]
+            pos += size
+
+    def _lines(self):
+        data = self._map
+        pos = 0
+        timestamp = None
+        day = last = 0.0
+        released = 0
+        while pos < len(data):
+            released = self._release(released, pos)
+            end = data.find(b'\n', pos)
+            if end < 0:
+                end = len(data)
+            start = data.find(b'$', pos, end)
+            if start < 0:
+                start = data.find(b'!', pos, end)
+            if start >= 0:
+                line = data[start:end].rstrip(b'\r')
+                seconds = _sentence_time(line)
+                if seconds is not None:
+                    if seconds < last - 43200:
+                        day += 86400  # переход через полночь
+                    last = seconds
+                    timestamp = day + seconds
+                yield timestamp, 0, TX, line + b'\r\n'
+            pos = end + 1
+
+
+class Replay:
+    """Воспроизведение захвата: пакеты TX одного подключения с исходными интервалами.
+
+    speed - ускорение (1 - реальное время, 0 - максимальная скорость).
+    Захват повторяется по кругу, время пачек монотонно растет.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.reader = CaptureReader(path)
+        self.speed = speed
+        self._cursor = None
+        self._start = None
+        self._current = self._next = None
+
+    def bursts(self):
+        """Пачки (время от начала воспроизведения, кортеж буферов); записи с одним временем - одна пачка."""
+        offset = 0.0
+        while True:
+            first = conn = timestamp = None
+            buffers = []
+            for record_time, record_conn, direction, data in self.reader:
+                if direction != TX:
+                    continue
+                if conn is None:
+                    # Клиенты получали одинаковый поток, воспроизводится первое подключение
+                    conn = record_conn
+                if record_conn != conn:
+                    continue
+                if record_time is None:
+                    record_time = timestamp  # строка лога без времени - в пачку предыдущей
+                elif first is None:
+                    first = timestamp = record_time
+                if buffers and (record_time != timestamp or len(buffers) >= MAX_BURST):
+                    # Строки лога до первого сообщения со временем (например, только !AIVDM) - в начале прохода
+                    yield offset + (timestamp - first if first is not None else 0.0), Packet(buffers)
+                    buffers = []
+                timestamp = record_time
+                buffers.append(bytes(data))
+            if conn is None:
+                raise ValueError(f"{self.reader.path}: no TX records to replay")
+            elapsed = timestamp - first if first is not None else 0.0
+            yield offset + elapsed, Packet(buffers)
+            offset += elapsed + LOOP_GAP
+
+    def reply(self, now):
+        """Записанный ответ, актуальный на момент now (time.monotonic()), для серверов запрос-ответ."""
+        if self._cursor is None:
+            self._cursor = self.bursts()
+            self._start = now
+            self._current, self._next = next(self._cursor), next(self._cursor)
+        if not self.speed:
+            self._current, self._next = self._next, next(self._cursor)
+        else:
+            elapsed = (now - self._start) * self.speed
+            while self._next[0] <= elapsed:
+                self._current, self._next = self._next, next(self._cursor)
+        return self._current[1]
+
+    def __str__(self):
+        speed = f"{self.speed:g}x" if self.speed else "max speed"
+        kind = "capture" if self.reader.binary else "NMEA log"
+        return f"Replay {kind} {self.reader.path} at {speed}"
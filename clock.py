@@ -0,0 +1,127 @@
+import argparse
+import calendar
+import math
+import threading
+import time
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def parse_utc(value):
+    """Время UTC "2016-12-31T23:59:50[.5][Z]" -> секунды от эпохи."""
+    text = value[:-1] if value.endswith('Z') else value
+    text, _, fraction = text.partition('.')
+    try:
+        seconds = calendar.timegm(time.strptime(text, TIME_FORMAT))
+        return seconds + (float('0.' + fraction) if fraction else 0.0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid UTC time {value!r}, expected YYYY-MM-DDTHH:MM:SS[.fff]")
+
+
+def parse_scale(value):
+    """Тип аргумента --clock-scale: скорость модельного времени относительно реального, > 0."""
+    try:
+        scale = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid clock scale: {value}")
+    if scale <= 0:
+        raise argparse.ArgumentTypeError("clock scale must be > 0 (use --clock-frozen to stop time)")
+    return scale
+
+
+def parse_jump(value):
+    """Скачок "AFTER:+SECONDS", "AFTER:-SECONDS" или "AFTER:YYYY-MM-DDTHH:MM:SS" -> (AFTER, сдвиг, время).
+
+    AFTER - секунды реального времени от старта сервиса; скачок задается
+    либо сдвигом модельного времени, либо новым моментом UTC.
+    """
+    after, _, target = value.partition(':')
+    try:
+        after = float(after)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid clock jump {value!r}, expected AFTER:+SECONDS or AFTER:UTC")
+    if after < 0 or not target:
+        raise argparse.ArgumentTypeError(f"invalid clock jump {value!r}, expected AFTER:+SECONDS or AFTER:UTC")
+    if target[0] in '+-':
+        try:
+            return after, float(target), None
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid clock jump offset: {value}")
+    return after, None, parse_utc(target)
+
+
+class Clock:
+    """Модельное время сервиса: сдвиг, масштаб, остановка и скачки по сценарию.
+
+    Модельное время - линейная функция реального: anchor_sim + (real -
+    anchor_real) * scale. Параметры хранятся одним кортежем и заменяются
+    целиком, поэтому чтение не требует блокировки; блокировка нужна
+    только при срабатывании скачка. Реальное время - монотонные часы,
+    привязанные к UTC при создании, как в tick_scheduler.TickScheduler:
+    при масштабе 1 без сдвига тик n приходится ровно на n / rate.
+    """
+
+    def __init__(self, offset=0.0, scale=1.0, start=None, frozen=False, jumps=()):
+        self._real_offset = time.time() - time.monotonic()
+        # Привязка к границе секунды: тики на границах 1 / rate дают круглые доли секунды и в модельном времени
+        real = math.floor(self.real())
+        sim = (start if start is not None else real) + offset
+        self._state = (real, sim, 0.0 if frozen else scale)
+        self._jumps = sorted((real + after, delta, target) for after, delta, target in jumps)
+        self._lock = threading.Lock()
+        self.jumps = 0
+
+    def real(self):
+        """Реальное время UTC по монотонным часам."""
+        return time.monotonic() + self._real_offset
+
+    def at(self, real):
+        """Модельное время на реальный момент real (сек от эпохи)."""
+        if self._jumps and real >= self._jumps[0][0]:
+            self._jump(real)
+        anchor_real, anchor_sim, scale = self._state
+        return anchor_sim + (real - anchor_real) * scale
+
+    def now(self):
+        return self.at(self.real())
+
+    @property
+    def scale(self):
+        return self._state[2]
+
+    def _jump(self, real):
+        with self._lock:
+            while self._jumps and real >= self._jumps[0][0]:
+                moment, delta, target = self._jumps.pop(0)
+                anchor_real, anchor_sim, scale = self._state
+                sim = anchor_sim + (moment - anchor_real) * scale
+                self._state = (moment, sim + delta if delta is not None else target, scale)
+                self.jumps += 1
+
+    def __str__(self):
+        scale = self.scale
+        mode = "frozen" if scale == 0 else f"x{scale:g}"
+        now = self.now()
+        stamp = time.strftime(TIME_FORMAT, time.gmtime(now)) + f".{int(now % 1 * 1000):03d}Z"
+        return f"Clock {mode}: {stamp}, jumps {self.jumps} done, {len(self._jumps)} pending"
+
+
+def add_clock_arguments(parser):
+    """Ключи модельного времени, общие для nmeaServer.py и usv2Server.py."""
+    parser.add_argument('--clock-start', type=parse_utc,
+                        help='Start simulated time at this UTC moment, YYYY-MM-DDTHH:MM:SS[.fff]')
+    parser.add_argument('--clock-offset', type=float, default=0.0, help='Shift simulated time, seconds')
+    parser.add_argument('--clock-scale', type=parse_scale, default=1.0,
+                        help='Simulated seconds per real second, e.g. 1000 for accelerated time')
+    parser.add_argument('--clock-frozen', action='store_true', help='Stop simulated time at its start value')
+    parser.add_argument('--clock-jump', type=parse_jump, action='append', default=[],
+                        help='Scripted time jump AFTER:+SECONDS, AFTER:-SECONDS or AFTER:UTC, '
+                             'AFTER in real seconds since start, repeatable')
+
+
+def create_clock(args):
+    """Модельное время по ключам командной строки или None, если сервис работает по часам системы."""
+    if (args.clock_start is None and not args.clock_offset and args.clock_scale == 1.0
+            and not args.clock_frozen and not args.clock_jump):
+        return None
+    return Clock(args.clock_offset, args.clock_scale, args.clock_start, args.clock_frozen, args.clock_jump)
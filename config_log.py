@@ -1,15 +1,109 @@
+import atexit
 import logging
+import os
+import queue
 import sys
+import time
 import traceback
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-def setup_logger(log_file='nmeasrv.log'):
-    """Настройка логгера с трейсом, но без строк кода."""
+TRAFFIC_LOG_LIMIT = 10  # записей трассировки пакетов в секунду
+
+_listener = None
+
+
+class TrafficData:
+    """Пакет в трассировке TX/RX: строка собирается только при записи в обработчике."""
+
+    __slots__ = ("data", "hex")
+
+    def __init__(self, data, hex=False):
+        self.data = data
+        self.hex = hex
+
+    def __str__(self):
+        data = self.data if isinstance(self.data, bytes) else b''.join(self.data)
+        return data.hex('_').upper() if self.hex else str(data)
+
+
+# Аргументы этих типов не меняются после вызова, сообщение можно собрать в потоке QueueListener
+_DEFERRED_ARGS = (str, bytes, int, float, TrafficData, type(None))
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Стандартный prepare() форматирует запись целиком в потоке клиента
+        if record.args and not (isinstance(record.args, tuple) and
+                                all(isinstance(arg, _DEFERRED_ARGS) for arg in record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class TrafficLog:
+    """Трассировка пакетов с ограничением частоты: не больше limit записей в секунду.
+
+    Сообщение не форматируется, если уровень отключен или лимит исчерпан;
+    число пропущенных записей выводится раз в секунду.
+    """
+
+    def __init__(self, logger, limit=TRAFFIC_LOG_LIMIT):
+        self.logger = logger
+        self.limit = limit
+        self._second = 0
+        self._count = 0
+        self._suppressed = 0
+
+    def log(self, level, msg, *args):
+        if not self.limit or not self.logger.isEnabledFor(level):
+            return
+        second = int(time.monotonic())
+        if second != self._second:
+            if self._suppressed:
+                self.logger.log(level, "Traffic log: %d records suppressed", self._suppressed)
+            self._second = second
+            self._count = self._suppressed = 0
+        self._count += 1
+        if self._count > self.limit:
+            self._suppressed += 1
+            return
+        self.logger.log(level, msg, *args)
+
+
+# Общая трассировка пакетов сервиса, лимит задает ключ --log-traffic
+traffic_log = TrafficLog(logging.getLogger(__name__))
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_listener():
+    # Поток QueueListener не переживает fork: рабочему процессу нужен свой поток и своя очередь
+    global _listener
+    if _listener is None:
+        return
+    handler = next(h for h in logging.getLogger(__name__).handlers if isinstance(h, QueueHandler))
+    handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def setup_logger(log_file='nmeasrv.log', queued=True):
+    """Настройка логгера с трейсом, но без строк кода.
+
+    queued: запись в файл и консоль из отдельного потока QueueListener,
+    потоки клиентов только кладут запись в очередь.
+    """
+    global _listener
     logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
     logger.propagate = False
-    
+
     # Очистка старых обработчиков
+    _stop_listener()
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
 
@@ -24,7 +118,8 @@ def setup_logger(log_file='nmeasrv.log'):
         log_file,
         maxBytes=5*1024*1024,
         backupCount=3,
-        encoding='utf-8'
+        encoding='utf-8',
+        delay=True  # файл открывается при первой записи
     )
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(formatter)
@@ -34,13 +129,27 @@ def setup_logger(log_file='nmeasrv.log'):
     console_handler.setLevel(logging.DEBUG)
     console_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    handlers = (file_handler, console_handler)
+    # Записи ниже уровня всех обработчиков отбрасываются до форматирования
+    logger.setLevel(min(handler.level for handler in handlers))
+    if queued:
+        queue_handler = _QueueHandler(queue.SimpleQueue())
+        logger.addHandler(queue_handler)
+        _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
 
     return logger
 
+
+atexit.register(_stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener)
+
 # Пример использования
 # logger.debug('Отладочное сообщение (только в консоль)')
 # logger.info('Информационное сообщение (в консоль и файл)')
 # logger.warning('Предупреждение (в консоль и файл)')
-# logger.error('Ошибка (в консоль и файл)', exc_info=True)
\ No newline at end of file
+# logger.error('Ошибка (в консоль и файл)', exc_info=True)
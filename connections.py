@@ -0,0 +1,74 @@
+import logging
+import threading
+
+# Общий логгер сервиса, обработчики настраивает setup_logger() в скрипте сервера
+logger = logging.getLogger("config_log")
+
+
+def raise_file_limit():
+    """Поднимает мягкий лимит открытых файлов до жесткого, чтобы число подключений ограничивала память.
+
+    Возвращает новый лимит или None, если модуля resource нет (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError) as e:
+            logger.warning(f"Open files limit stays at {soft}: {e}")
+    logger.info(f"Open files limit {soft}")
+    return soft
+
+
+class ConnectionTable:
+    """Подключения сервера: плотный список без дыр и счетчики за O(1).
+
+    Подключение хранит свой индекс в атрибуте slot. Удаление переносит
+    последнее подключение на место удаляемого, поэтому add() и remove()
+    не зависят от числа подключений, а на каждое приходится один
+    указатель списка. Обход - по списку, без хеширования, как у set.
+    Блокировка нужна движку с потоком на клиента: подключения добавляет
+    поток сервера, а удаляют потоки клиентов.
+    """
+
+    __slots__ = ("_items", "_lock", "peak", "total")
+
+    def __init__(self):
+        self._items = []
+        self._lock = threading.Lock()
+        self.peak = 0  # наибольшее число одновременных подключений
+        self.total = 0  # подключений с запуска
+
+    def add(self, connection):
+        with self._lock:
+            connection.slot = len(self._items)
+            self._items.append(connection)
+            self.total += 1
+            if len(self._items) > self.peak:
+                self.peak = len(self._items)
+
+    def remove(self, connection):
+        with self._lock:
+            slot = connection.slot
+            if slot < 0:
+                return
+            last = self._items.pop()
+            if last is not connection:
+                self._items[slot] = last
+                last.slot = slot
+            connection.slot = -1
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        # Снимок: подключения могут закрываться во время обхода
+        return iter(self._items[:])
+
+    def __str__(self):
+        return f"Total clients: {len(self._items)} (peak {self.peak}, {self.total} since start)"
@@ -0,0 +1,182 @@
+import json
+import logging
+import threading
+from devices import TALKER_IDS, STATUSES, FIXED
+from nmea_sentence import make_fix
+from tick_scheduler import MAX_RATE
+
+# Общий логгер сервиса, обработчики настраивает setup_logger() в скрипте сервера
+logger = logging.getLogger("config_log")
+
+DEFAULT_HOST = '127.0.0.1'  # API меняет состояние эмулятора, поэтому по умолчанию только локальный доступ
+MAX_BODY = 64 * 1024  # байт
+CLOCK_STATUSES = (0x00, 0x80)
+
+
+def _number(value, name):
+    # bool - подкласс int, но "rate": true - ошибка клиента
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number")
+    return float(value)
+
+
+def parse_position(value):
+    """{"lat": 59.93, "lon": 30.31, "sog": 0, "cog": 0} -> поля RMC; sog и cog необязательны."""
+    if not isinstance(value, dict) or "lat" not in value or "lon" not in value:
+        raise ValueError("position must be an object with lat and lon")
+    lat = _number(value["lat"], "lat")
+    lon = _number(value["lon"], "lon")
+    sog = _number(value.get("sog", 0), "sog")
+    cog = _number(value.get("cog", 0), "cog")
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise ValueError("lat must be in [-90, 90], lon in [-180, 180]")
+    if sog < 0:
+        raise ValueError("sog must be >= 0")
+    return make_fix(lat, lon, sog, cog)
+
+
+class NMEAControl:
+    """Состояние сервера NMEA для API управления: статус, talker ID и позиция приемников, частота тиков.
+
+    Изменение - замена кортежа состояния приемника (devices.NMEADevice.update)
+    и новая частота планировщика: клиенты видят их со следующего тика.
+    fleet - модель движения сервера: позицию приемников, которые берут ее
+    из модели, API не меняет.
+    """
+
+    FIELDS = ("port", "status", "id", "position", "rate")
+
+    def __init__(self, devices, scheduler, fleet=None):
+        self._devices = devices
+        self._scheduler = scheduler
+        self._fleet = fleet
+        self._lock = threading.Lock()  # запросы API обслуживаются параллельно, update не должны теряться
+
+    def state(self):
+        return {
+            "rate": self._scheduler.target_rate,
+            "devices": [{
+                "port": device.port,
+                "id": device.id,
+                "status": device.status,
+                "sentences": list(device.sentences),
+                "position": device.position,
+                "fix": b','.join(device.fix).decode('ascii'),
+            } for device in self._devices],
+        }
+
+    def apply(self, changes):
+        """Проверка и применение изменений; ошибка в любом поле - ValueError, ничего не меняется."""
+        if not isinstance(changes, dict):
+            raise ValueError("JSON object expected")
+        unknown = set(changes) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"unknown fields {sorted(unknown)}, expected {list(self.FIELDS)}")
+        devices = self._devices
+        if "port" in changes:
+            devices = [device for device in devices if device.port == changes["port"]]
+            if not devices:
+                raise ValueError(f"no device on port {changes['port']}")
+        status = changes.get("status")
+        if status is not None and status not in STATUSES:
+            raise ValueError(f"status must be one of {STATUSES}")
+        id = changes.get("id")
+        if id is not None and id not in TALKER_IDS:
+            raise ValueError(f"talker id must be one of {TALKER_IDS}")
+        fix = parse_position(changes["position"]) if "position" in changes else None
+        if fix is not None and self._fleet is not None:
+            # Клиенты таких приемников получают позицию судна модели, поле fix они не читают
+            moving = [device.port for device in devices if device.position != FIXED]
+            if moving:
+                raise ValueError(f"position is taken from the vessel model on ports {moving}, "
+                                 f"it can be set only for devices with \"position\": \"{FIXED}\"")
+        rate = changes.get("rate")
+        if rate is not None:
+            rate = _number(rate, "rate")
+            if not 0 < rate <= MAX_RATE:
+                raise ValueError(f"rate must be in (0, {MAX_RATE}] Hz")
+        with self._lock:
+            for device in devices:
+                device.update(id, status, fix)
+            if rate is not None:
+                self._scheduler.set_rate(rate)
+        logger.info(f"Control: {changes}")
+        return self.state()
+
+
+class USV2Control:
+    """Состояние сервера УСВ2 для API управления: байт статуса часов 0x00/0x80."""
+
+    def __init__(self, clock):
+        self._clock = clock  # multiprocessing.RawValue, общий для рабочих процессов
+
+    def state(self):
+        return {"clock": self._clock.value}
+
+    def apply(self, changes):
+        if not isinstance(changes, dict) or set(changes) != {"clock"}:
+            raise ValueError('{"clock": 0 | 128} expected')
+        clock = changes["clock"]
+        if isinstance(clock, bool) or clock not in CLOCK_STATUSES:
+            raise ValueError(f"clock must be one of {CLOCK_STATUSES}")
+        self._clock.value = clock
+        logger.info(f"Control: new status clock 0x{clock:02X}")
+        return self.state()
+
+
+class _ControlHandler:
+    """Обработчик запросов; http.server.BaseHTTPRequestHandler подмешивается в ControlServer."""
+
+    def do_GET(self):
+        if self.path != "/state":
+            self.send_error(404)
+            return
+        self._reply(200, self.server.control.state())
+
+    def do_POST(self):
+        if self.path != "/state":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(f"invalid Content-Length: {length}")
+            if length > MAX_BODY:
+                self.send_error(413)
+                return
+            changes = json.loads(self.rfile.read(length) or b'null')
+            state = self.server.control.apply(changes)
+        except ValueError as e:  # неверный Content-Length; json.JSONDecodeError - подкласс ValueError
+            self._reply(400, {"error": str(e)})
+            return
+        self._reply(200, state)
+
+    def _reply(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Изменения пишет в лог сам NMEAControl/USV2Control
+        pass
+
+
+class ControlServer(threading.Thread):
+    """HTTP API управления без перезапуска: GET /state - состояние, POST /state - изменение (JSON)."""
+
+    def __init__(self, control, port, host=DEFAULT_HOST, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Импорт http.server отложен: NMEAControl/USV2Control создаются всегда, сервер API - только с --control-port
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        handler = type("ControlHandler", (_ControlHandler, BaseHTTPRequestHandler), {})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._httpd.control = control
+        self._address = f"{host}:{port}"
+
+    def run(self):
+        logger.info(f"Control API started on {self._address}")
+        self._httpd.serve_forever()
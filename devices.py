@@ -0,0 +1,144 @@
+import argparse
+import json
+from udp_output import parse_destination
+from serial_output import parse_serial
+from nmea_sentence import DEFAULT_FIX, select_sentences
+
+TALKER_IDS = ("GP", "GN", "GL", "BD", "GA")
+STATUSES = ("A", "V")
+FIXED = "fixed"  # неподвижная позиция по умолчанию
+FLEET = "fleet"  # каждому клиенту следующее судно модели движения
+
+
+class NMEADevice:
+    """Профиль эмулируемого приемника: порт, talker ID, набор сообщений, статус и источник позиции.
+
+    sentences: имена сообщений в порядке выдачи (nmea_sentence.select_sentences).
+    position: "fixed", "fleet" или номер судна модели движения.
+    udp: адресаты UDP (host, port), которым пакеты приемника рассылаются каждый тик.
+    serial: последовательные выводы (путь, скорость, ссылка) - псевдотерминалы или порты (serial_output).
+    fix: поля RMC неподвижной позиции (nmea_sentence.make_fix).
+
+    Параметры пакета хранятся одним кортежем state и заменяются целиком
+    (update): сервер читает его один раз за тик, поэтому изменение из
+    API управления стоит O(1) при любом числе клиентов и не бывает видно
+    наполовину. После share() статус хранится в разделяемой памяти и
+    одинаков во всех рабочих процессах сервера.
+    """
+
+    __slots__ = ("port", "position", "udp", "serial", "_state", "_shared", "_index", "_next_vessel")
+
+    def __init__(self, port, id="GP", sentences=("RMC",), status="A", position=FIXED, udp=(), serial=(),
+                 fix=DEFAULT_FIX):
+        self.port = port
+        self.position = position
+        self.udp = list(udp)
+        self.serial = list(serial)
+        self._state = (id, status, select_sentences(sentences), fix)
+        self._shared = None
+        self._index = 0
+        self._next_vessel = 0
+
+    @property
+    def state(self):
+        """Кортеж (talker ID, статус, сообщения, fix) для SentenceCache.get."""
+        state = self._state
+        if self._shared is not None:
+            status = self._shared[self._index].decode('ascii')
+            if status != state[1]:
+                state = self._state = (state[0], status) + state[2:]
+        return state
+
+    @property
+    def id(self):
+        return self._state[0]
+
+    @property
+    def status(self):
+        return self.state[1]
+
+    @status.setter
+    def status(self, value):
+        self.update(status=value)
+
+    @property
+    def sentences(self):
+        return self._state[2]
+
+    @property
+    def fix(self):
+        return self._state[3]
+
+    def update(self, id=None, status=None, fix=None):
+        """Замена параметров пакета одним присваиванием, действует со следующего тика."""
+        old_id, old_status, sentences, old_fix = self.state
+        if status is not None and self._shared is not None:
+            self._shared[self._index] = status.encode('ascii')
+        self._state = (id or old_id, status or old_status, sentences, fix or old_fix)
+
+    def share(self, values, index):
+        """Перенос статуса в разделяемый массив values (multiprocessing.RawArray('c'))."""
+        values[index] = self._state[1].encode('ascii')
+        self._shared = values
+        self._index = index
+
+    def assign_vessel(self, fleet):
+        """Источник позиции нового клиента: None - неподвижная позиция, иначе номер судна."""
+        if fleet is None or self.position == FIXED:
+            return None
+        if self.position == FLEET:
+            vessel = self._next_vessel % fleet.n
+            self._next_vessel += 1
+            return vessel
+        return self.position % fleet.n
+
+    def toggle_rmc_status(self):
+        self.status = "V" if self.status == "A" else "A"
+
+    def __str__(self):
+        sentences = "+".join(self.sentences)
+        return f"[{self.port} {self.id} {sentences or '-'} {self.status} {self.position}]"
+
+
+def _parse_device(item, number):
+    try:
+        port = int(item["port"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Device #{number}: integer 'port' is required")
+    id = item.get("id", "GP")
+    status = item.get("status", "A")
+    sentences = item.get("sentences", ["RMC"])
+    position = item.get("position", FIXED)
+    if id not in TALKER_IDS:
+        raise ValueError(f"Device #{number}: talker id must be one of {TALKER_IDS}")
+    if status not in STATUSES:
+        raise ValueError(f"Device #{number}: status must be one of {STATUSES}")
+    try:
+        sentences = select_sentences(sentences)
+    except ValueError as e:
+        raise ValueError(f"Device #{number}: {e}")
+    if position not in (FIXED, FLEET) and not isinstance(position, int):
+        raise ValueError(f"Device #{number}: position must be \"{FIXED}\", \"{FLEET}\" or vessel number")
+    try:
+        udp = [parse_destination(destination) for destination in item.get("udp", [])]
+    except argparse.ArgumentTypeError as e:
+        raise ValueError(f"Device #{number}: {e}")
+    try:
+        serial = [parse_serial(output) for output in item.get("serial", [])]
+    except argparse.ArgumentTypeError as e:
+        raise ValueError(f"Device #{number}: {e}")
+    return NMEADevice(port, id, sentences, status, position, udp, serial)
+
+
+def load_devices(path):
+    """Чтение профилей приемников из JSON: {"devices": [{"port": 5007, "id": "GP", ...}, ...]}"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    items = config.get("devices") if isinstance(config, dict) else None
+    if not items:
+        raise ValueError(f"{path}: non-empty \"devices\" list is required")
+    devices = [_parse_device(item, number) for number, item in enumerate(items, 1)]
+    ports = [device.port for device in devices]
+    if len(set(ports)) != len(ports):
+        raise ValueError(f"{path}: device ports must be unique")
+    return devices
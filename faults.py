@@ -0,0 +1,177 @@
+import argparse
+import itertools
+import random
+from metrics import key
+from usv2_packet import calc_crc, PACKET_SIZE, STATUS_OFFSET
+
+# Искажения потока NMEA, в порядке применения к пакету тика
+NMEA_FAULTS = ("checksum", "truncate", "duplicate", "delay", "reorder", "split")
+# Искажения ответов УСВ2
+USV2_FAULTS = ("bcd", "crc", "truncate", "duplicate", "delay")
+BCD_FIELDS = range(2, 8)  # байты ГГ ММ ДД чч мм сс пакета даты и времени
+
+
+def parse_faults(value, allowed):
+    """Спецификация "checksum=0.01,delay=0.05" -> {искажение: вероятность на пакет}."""
+    faults = {}
+    for item in filter(None, value.split(',')):
+        name, _, probability = item.partition('=')
+        name = name.strip()
+        if name not in allowed:
+            raise argparse.ArgumentTypeError(f"unknown fault {name!r}, expected one of {', '.join(allowed)}")
+        try:
+            probability = float(probability)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"fault {name}: invalid probability {probability!r}")
+        if not 0 <= probability <= 1:
+            raise argparse.ArgumentTypeError(f"fault {name}: probability must be in [0, 1]")
+        faults[name] = probability
+    return faults
+
+
+def parse_nmea_faults(value):
+    """Тип аргумента --faults сервера NMEA."""
+    return parse_faults(value, NMEA_FAULTS)
+
+
+def parse_usv2_faults(value):
+    """Тип аргумента --faults сервера УСВ2."""
+    return parse_faults(value, USV2_FAULTS)
+
+
+def parse_fraction(value):
+    """Тип аргумента --fault-clients: доля клиентов с искажениями, 0..1."""
+    try:
+        fraction = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid fraction: {value}")
+    if not 0 <= fraction <= 1:
+        raise argparse.ArgumentTypeError("fraction must be in [0, 1]")
+    return fraction
+
+
+class FaultProfile:
+    """Настройка искажений сервиса: вероятности, зерно и доля затронутых клиентов.
+
+    Клиент с номером подключения n получает свой генератор с зерном
+    (seed, n), поэтому при том же порядке подключений последовательность
+    искажений каждого клиента воспроизводится. Клиенты вне доли clients
+    получают None и отправляют общий пакет тика без проверок.
+    """
+
+    def __init__(self, faults, seed=None, clients=1.0, family="nmea_faults_total"):
+        self.faults = {name: probability for name, probability in faults.items() if probability > 0}
+        # Зерно пишется в лог, чтобы прогон со случайным зерном можно было повторить
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(1 << 32)
+        self.clients = clients
+        self._keys = {name: key(family, fault=name) for name in self.faults}
+        self._numbers = itertools.count()
+        self._select = random.Random(self.seed)
+
+    def injector(self, stats=None):
+        """Искажения нового клиента или None, если клиент получает чистый поток."""
+        number = next(self._numbers)
+        if not self.faults or self._select.random() >= self.clients:
+            return None
+        return FaultInjector(self.faults, random.Random(self.seed * 1000003 + number), self._keys, stats)
+
+    def __str__(self):
+        faults = ", ".join(f"{name}={probability:g}" for name, probability in self.faults.items())
+        return f"Fault injection: {faults or 'none'}, {self.clients:.0%} of clients, seed {self.seed}"
+
+
+class FaultInjector:
+    """Искажения потока одного клиента.
+
+    Общий пакет не меняется: новые буферы создаются только для искаженных
+    сообщений, остальные элементы кортежа остаются теми же объектами.
+    Задержка, перестановка и разрыв пакета переносят буферы на следующий
+    тик (для УСВ2 - на следующий запрос).
+    """
+
+    __slots__ = ("_faults", "_random", "_keys", "_stats", "_held", "_swapped")
+
+    def __init__(self, faults, rng, keys, stats=None):
+        self._faults = faults
+        self._random = rng
+        self._keys = keys
+        self._stats = stats  # metrics.Shard владельца клиента
+        self._held = ()  # уйдет перед следующим пакетом
+        self._swapped = ()  # уйдет после следующего пакета
+
+    def _hit(self, name):
+        probability = self._faults.get(name)
+        if probability is None or self._random.random() >= probability:
+            return False
+        if self._stats is not None:
+            self._stats.counters[self._keys[name]] += 1
+        return True
+
+    def _pick(self, buffers):
+        # Индекс сообщения пакета; пустые пакеты (только конец строки) не искажаются
+        index = self._random.randrange(len(buffers))
+        return index if len(buffers[index]) > 5 else None
+
+    def nmea(self, buffers):
+        """Кортеж буферов для отправки клиенту вместо пакета тика buffers (может быть пустым)."""
+        if self._hit("checksum"):
+            index = self._pick(buffers)
+            if index is not None:
+                sentence = buffers[index]
+                checksum = int(sentence[-4:-2], 16) ^ self._random.randrange(1, 256)
+                buffers = buffers[:index] + (sentence[:-4] + b'%02X\r\n' % checksum,) + buffers[index + 1:]
+        if self._hit("truncate"):
+            index = self._pick(buffers)
+            if index is not None:
+                sentence = buffers[index]
+                # Обрезанное сообщение без конца строки склеивается со следующим
+                buffers = buffers[:index] + (sentence[:self._random.randrange(1, len(sentence) - 2)],) + buffers[index + 1:]
+        if self._hit("duplicate"):
+            buffers = buffers + buffers
+        held, self._held = self._held, ()
+        swapped, self._swapped = self._swapped, ()
+        if self._hit("delay"):
+            # Тик уходит вместе со следующим, с опозданием на период
+            self._held = held + buffers + swapped
+            return ()
+        if self._hit("reorder"):
+            self._swapped = buffers
+            buffers = ()
+        elif self._hit("split"):
+            buffers, self._held = self._split(buffers)
+        return held + buffers + swapped
+
+    def _split(self, buffers):
+        # Разрыв пакета в случайном байте: начало сейчас, остаток - в начале следующего тика
+        offset = self._random.randrange(1, sum(len(buffer) for buffer in buffers))
+        for index, buffer in enumerate(buffers):
+            if offset < len(buffer):
+                return buffers[:index] + (buffer[:offset],), (buffer[offset:],) + buffers[index + 1:]
+            offset -= len(buffer)
+        return buffers, ()
+
+    def usv2(self, data):
+        """Ответ клиенту УСВ2 вместо data - одного или нескольких пакетов даты и времени подряд."""
+        packets = []
+        for start in range(0, len(data), PACKET_SIZE):
+            packet = data[start:start + PACKET_SIZE]
+            if self._hit("bcd"):
+                # Недопустимая тетрада BCD при верной CRC: ошибку должен найти разбор полей, а не проверка CRC
+                packet = bytearray(packet)
+                field = self._random.choice(BCD_FIELDS)
+                packet[field] = (packet[field] & 0xF0) | self._random.randrange(10, 16)
+                packet[STATUS_OFFSET + 1] = calc_crc(packet[2:STATUS_OFFSET + 1])
+                packet = bytes(packet)
+            if self._hit("crc"):
+                packet = packet[:-1] + bytes((packet[-1] ^ self._random.randrange(1, 256),))
+            if self._hit("truncate"):
+                packet = packet[:self._random.randrange(1, PACKET_SIZE)]
+            if self._hit("duplicate"):
+                packet = packet * 2
+            packets.append(packet)
+        held, self._held = self._held, ()
+        if self._hit("delay"):
+            # Ответ уходит только со следующим ответом
+            self._held = held + tuple(packets)
+            return b''
+        return b''.join(held + tuple(packets))
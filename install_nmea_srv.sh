@@ -26,12 +26,6 @@ if ! command -v pip3 &> /dev/null; then
     exit 1
 fi
 
-# Проверка установки pynmea2
-if ! pip3 list | grep pynmea2 &> /dev/null; then
-   echo "pynmea2 is not installed!"
-   exit 1
-fi
-
 # Проверка установки keyboard
 if ! pip3 list | grep keyboard &> /dev/null; then
    echo "keyboard is not installed!"
@@ -63,6 +57,7 @@ After=network.target
 ExecStart=${PYTHON_EXEC} ${SERVER_SCRIPT} --rmc --gsa --port $PORT
 Restart=always
 RestartSec=30s
+LimitNOFILE=1048576
 WorkingDirectory=${WORKDIR}
 #StandardOutput=append:/var/log/nmeasrv.log
 
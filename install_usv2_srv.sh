@@ -58,6 +58,7 @@ After=network.target
 ExecStart=${PYTHON_EXEC} ${SERVER_SCRIPT} --port $PORT
 Restart=always
 RestartSec=30s
+LimitNOFILE=1048576
 WorkingDirectory=${WORKDIR}
 #StandardOutput=append:/var/log/usv2srv.log
 
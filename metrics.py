@@ -0,0 +1,239 @@
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+# Общий логгер сервиса, обработчики настраивает setup_logger() в скрипте сервера
+logger = logging.getLogger("config_log")
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)  # sec
+
+# Имя метрики: (тип, описание)
+FAMILIES = {
+    "nmea_clients": ("gauge", "Connected NMEA TCP clients"),
+    "nmea_sentences_sent_total": ("counter", "NMEA sentences handed to TCP clients"),
+    "nmea_bytes_sent_total": ("counter", "NMEA bytes handed to TCP clients"),
+    "nmea_broadcast_seconds": ("histogram", "Time to hand one tick to all TCP clients (async engine)"),
+    "nmea_send_seconds": ("histogram", "Time to hand one tick to one TCP client (thread engine)"),
+    "nmea_ticks_total": ("counter", "Scheduler ticks"),
+    "nmea_late_ticks_total": ("counter", "Ticks woken up later than half an interval"),
+    "nmea_skipped_ticks_total": ("counter", "Ticks skipped because the loop fell behind"),
+    "nmea_tick_lateness_seconds": ("histogram", "Tick wake-up lateness"),
+    "nmea_disconnects_total": ("counter", "NMEA client disconnects by reason"),
+    "nmea_faults_total": ("counter", "Faults injected into NMEA client streams by type"),
+    "usv2_clients": ("gauge", "Connected USV2 clients"),
+    "usv2_requests_total": ("counter", "USV2 date/time requests answered"),
+    "usv2_response_seconds": ("histogram", "USV2 request processing time up to the reply write"),
+    "usv2_stray_bytes_total": ("counter", "Bytes outside USV2 request frames"),
+    "usv2_disconnects_total": ("counter", "USV2 client disconnects by reason"),
+    "usv2_faults_total": ("counter", "Faults injected into USV2 replies by type"),
+}
+
+
+def key(name, **labels):
+    """Ключ счетчика: имя и отсортированные метки. Ключи горячего пути создаются один раз."""
+    return name, tuple(sorted(labels.items()))
+
+
+@functools.lru_cache(maxsize=None)
+def sentence_keys(sentence_type):
+    return (key("nmea_sentences_sent_total", type=sentence_type.decode('ascii')),
+            key("nmea_bytes_sent_total", type=sentence_type.decode('ascii')))
+
+
+def count_sentences(shard, payload, clients=1):
+    """Учет пакета (кортежа сообщений), отправленного clients клиентам: сообщения и байты по типам."""
+    counters = shard.counters
+    for sentence in payload:
+        if len(sentence) > 6:
+            sentences, size = sentence_keys(sentence[3:6])
+            counters[sentences] += clients
+            counters[size] += clients * len(sentence)
+
+
+REQUESTS = key("usv2_requests_total")
+RESPONSE_TIME = key("usv2_response_seconds")
+STRAY_BYTES = key("usv2_stray_bytes_total")
+USV2_DISCONNECTS = {reason: key("usv2_disconnects_total", reason=reason) for reason in ("closed", "error")}
+
+
+def count_requests(shard, count, stray, start):
+    """Учет пачки запросов УСВ2: число запросов, посторонние байты и время от приема до записи ответа."""
+    if stray:
+        shard.counters[STRAY_BYTES] += stray
+    if count:
+        shard.counters[REQUESTS] += count
+        shard.observe(RESPONSE_TIME, time.perf_counter() - start)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Shard:
+    """Счетчики одного потока или цикла событий.
+
+    Пишет только владелец, поэтому в горячем пути обычное += без
+    блокировок; при опросе шарды всех потоков складываются.
+    """
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = Counter()
+        self.histograms = {}
+
+    def observe(self, key, value):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def merge(self, other):
+        # dict.copy и list() выполняются целиком под GIL: владелец может писать в шард во время опроса
+        for name, value in dict.copy(other.counters).items():
+            self.counters[name] += value
+        for name, histogram in list(other.histograms.items()):
+            copy = Histogram()
+            copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+            self.histograms.setdefault(name, Histogram()).merge(copy)
+
+
+class Metrics:
+    """Метрики процесса: шарды потоков и функции, читаемые при опросе (число клиентов, счетчики тиков)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shards = set()  # удаление за O(1): при частых переподключениях тысяч клиентов список был бы O(n)
+        self._retired = Shard()  # счетчики завершившихся потоков
+        self._callbacks = []
+
+    def shard(self):
+        shard = Shard()
+        with self._lock:
+            self._shards.add(shard)
+        return shard
+
+    def retire(self, shard):
+        """Шард завершившегося потока переносится в общий итог."""
+        with self._lock:
+            self._shards.discard(shard)
+            self._retired.merge(shard)
+
+    def register(self, name, callback, **labels):
+        """Значение name{labels} берется из callback() при каждом опросе."""
+        self._callbacks.append((key(name, **labels), callback))
+
+    def collect(self):
+        total = Shard()
+        with self._lock:
+            total.merge(self._retired)
+            for shard in self._shards:
+                total.merge(shard)
+        for name, callback in self._callbacks:
+            total.counters[name] = callback()
+        return total
+
+    def prometheus(self):
+        """Текстовый формат Prometheus 0.0.4."""
+        total = self.collect()
+        lines = []
+        for family, (kind, help) in FAMILIES.items():
+            counters = sorted(item for item in total.counters.items() if item[0][0] == family)
+            histograms = sorted((item for item in total.histograms.items() if item[0][0] == family),
+                                key=lambda item: item[0])
+            if not counters and not histograms:
+                continue
+            lines.append(f"# HELP {family} {help}")
+            lines.append(f"# TYPE {family} {kind}")
+            for (name, labels), value in counters:
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), histogram in histograms:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def json(self):
+        total = self.collect()
+        result = {}
+        for (name, labels), value in total.counters.items():
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), histogram in total.histograms.items():
+            result.setdefault(name, []).append({
+                "labels": dict(labels),
+                "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], histogram.counts)),
+                "sum": histogram.sum,
+                "count": histogram.count,
+            })
+        return json.dumps(result)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class _MetricsHandler:
+    """Обработчик запросов; http.server.BaseHTTPRequestHandler подмешивается в MetricsServer."""
+
+    def do_GET(self):
+        metrics = self.server.metrics
+        if self.path == "/metrics":
+            body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = metrics.json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Опросы Prometheus не пишутся в лог сервиса
+        pass
+
+
+class MetricsServer(threading.Thread):
+    """HTTP-сервер метрик в том же процессе: /metrics (Prometheus) и /metrics.json."""
+
+    def __init__(self, metrics, port, host='', *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # http.server - самый тяжелый импорт сервиса, он нужен только при заданном порте метрик
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        handler = type("MetricsHandler", (_MetricsHandler, BaseHTTPRequestHandler), {})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._httpd.metrics = metrics
+        self._port = port
+
+    def run(self):
+        logger.info(f"Metrics endpoint started on port {self._port}")
+        self._httpd.serve_forever()
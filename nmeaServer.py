@@ -1,42 +1,72 @@
 #!/usr/bin/python3
 import argparse
+import logging
 import socket
 import sys
 import os
 import time
 import threading
-import pynmea2
 import select
 import signal
-from config_log import setup_logger
+from config_log import setup_logger, traffic_log, TrafficData, TRAFFIC_LOG_LIMIT
+from nmea_sentence import SentenceCache, SENTENCES
+from tick_scheduler import TickScheduler, parse_rate
+from send_queue import SendQueue, POLICIES, DEFAULT_LIMIT, DEFAULT_POLICY, send_buffers, advance_buffers
+from devices import NMEADevice, FIXED, FLEET, load_devices
+from udp_output import UDPOutput, parse_destination
+from serial_output import SerialOutput, parse_serial
+from capture import CaptureWriter, Replay, TX, parse_speed
+from metrics import Metrics, MetricsServer, key, count_sentences
+from control import NMEAControl, ControlServer
+from faults import FaultProfile, parse_nmea_faults, parse_fraction
+from clock import add_clock_arguments, create_clock
+from connections import ConnectionTable, raise_file_limit
 
-logger = setup_logger()
+# Обработчики логгера настраивает main(): импорт модуля не создает файл лога
+logger = logging.getLogger("config_log")
+keyboard = None  # импортируется в keyhandler() только при интерактивном запуске
 
-try:
-    import keyboard
-except ImportError as e:
-    logger.error(e)
-    
 IS_WIN = sys.platform.startswith("win") or (sys.platform == "cli" and os.name == "nt")
 DEFAULT_PORT = 5007
-INTERVAL_TX_PACKET = 1  # sec
-
-class ClientSet(set):
-    def __str__(self):
-        return " ".join(f"[{v[0]}:{v[1]}]" for v in self)
+DEFAULT_RATE = 1  # Hz
+METRICS_INTERVAL = 60  # sec
+SEND_TIME = key("nmea_send_seconds")
+DISCONNECTS = {reason: key("nmea_disconnects_total", reason=reason) for reason in ("closed", "error", "slow_consumer")}
 
 
 class NMEAServer(threading.Thread):
     def __init__(self, host='', port=DEFAULT_PORT, clients=20, 
-                 rmc=True, gsa=False, status="A", id="GP", *args, **kwargs):
+                 sentences=("RMC",), status="A", id="GP", rate=DEFAULT_RATE,
+                 queue_limit=DEFAULT_LIMIT, slow_policy=DEFAULT_POLICY, fleet=None, reuse_port=False,
+                 udp=(), udp_ttl=1, serial=(), capture=None, metrics=None, faults=None, clock=None,
+                 *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._host = host
         self._port = port
         self._clients = clients
-        self._rmc = rmc
-        self._gsa = gsa
-        self._status = status
-        self._id = id
+        self._reuse_port = reuse_port
+        # Каждый поток пишет в свой шард метрик: планировщик, клиенты
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._scheduler = TickScheduler(rate, self.metrics.shard(), clock)
+        self.metrics.register("nmea_clients", lambda: len(NMEAClient._clients))
+        self.metrics.register("nmea_ticks_total", lambda: self._scheduler.ticks)
+        self.metrics.register("nmea_late_ticks_total", lambda: self._scheduler.late_ticks)
+        self.metrics.register("nmea_skipped_ticks_total", lambda: self._scheduler.skipped_ticks)
+        self._queue_limit = queue_limit
+        self._slow_policy = slow_policy
+        self._fleet = fleet
+        self._device = NMEADevice(port, id, sentences, status, FLEET, udp, serial)
+        self.devices = [self._device]
+        self.control = NMEAControl(self.devices, self._scheduler, fleet)
+        self._udp_ttl = udp_ttl
+        self._capture = capture
+        self._faults = faults
+        NMEAClient._cache.fleet = fleet
+
+    def toggle_rmc_status(self):
+        # Статус общий для всех клиентов сервера: переключение за O(1), без обхода потоков
+        self._device.toggle_rmc_status()
+        logger.debug(f"New status \"{self._device.status}\" for RMC packet")
 
     def run(self):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
@@ -45,6 +75,9 @@ class NMEAServer(threading.Thread):
                 # не дожидаясь истечения его естественного тайм-аута.
                 logger.info(f"Starting NMEA Server on port {self._port}...")
                 sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self._reuse_port:
+                    # Порт делят рабочие процессы, ядро распределяет между ними подключения
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
                 sock.bind((self._host, self._port))
                 sock.listen(self._clients)
                 sock.setblocking(False)
@@ -52,109 +85,249 @@ class NMEAServer(threading.Thread):
                 logger.error(e.strerror, exc_info=True)
                 return
             logger.info(f"NMEA Server started on port {self._port}")
+            threading.Thread(target=self._scheduler.run, name="TickScheduler", daemon=True).start()
+            udp_output = None
+            if self._device.udp:
+                udp_output = UDPOutput(self._device.udp, self._udp_ttl)
+                threading.Thread(target=self._send_udp, args=(udp_output,), name="UDPOutput", daemon=True).start()
+                logger.info(f"NMEA UDP output started {udp_output}")
+            serial_outputs = []
+            for path, baud, link in self._device.serial:
+                output = SerialOutput(path, baud, link)
+                serial_outputs.append(output)
+                threading.Thread(target=self._send_serial, args=(output,), name="SerialOutput", daemon=True).start()
+                logger.info(f"NMEA serial output started {output}")
+            metrics_time = time.monotonic()
             while True:
+                if time.monotonic() - metrics_time >= METRICS_INTERVAL:
+                    metrics_time = time.monotonic()
+                    logger.info(NMEAClient._cache)
+                    logger.info(self._scheduler.report())
+                    logger.info(NMEAClient._get_total_clients())
+                    logger.info(NMEAClient._get_slow_clients())
+                    if self._scheduler.clock is not None:
+                        logger.info(self._scheduler.clock)
+                    if udp_output is not None:
+                        logger.info(udp_output)
+                    for output in serial_outputs:
+                        logger.info(output)
                 ready = select.select([sock], [], [], 1)
                 if ready[0]:
                     conn, addr = sock.accept()
                     logger.info(f"Connection detected from {addr[0]}:{addr[1]}")
+                    vessel = self._device.assign_vessel(self._fleet)
                     client = NMEAClient(name=f"NMEAClient {addr}", 
                                         daemon=True,
                                         conn=conn, 
                                         addr=addr,
-                                        rmc=self._rmc, 
-                                        gsa=self._gsa, 
-                                        status=self._status, 
-                                        id=self._id
+                                        device=self._device,
+                                        scheduler=self._scheduler,
+                                        queue=SendQueue(self._queue_limit, self._slow_policy),
+                                        vessel=vessel,
+                                        capture=self._capture,
+                                        metrics=self.metrics,
+                                        faults=self._faults,
                                         )
                     client.start()
 
 
+    def _send_udp(self, output):
+        # Один поток на все адресаты UDP: пакет тика из общего кэша, один sendto на адресата
+        device = self._device
+        vessel = device.assign_vessel(self._fleet)
+        tick = None
+        while True:
+            tick = self._scheduler.wait(tick)
+            id, status, sentences, fix = device.state
+            output.send(NMEAClient._cache.get(self._scheduler.timestamp(tick), id, status, sentences, vessel, fix,
+                                              self._scheduler.real(tick)))
+
+    def _send_serial(self, output):
+        # Поток на последовательный вывод: между тиками он выдает байты в линию со скоростью baud
+        device = self._device
+        vessel = device.assign_vessel(self._fleet)
+        tick = None
+        delay = None
+        while True:
+            current = self._scheduler.wait(tick, delay)
+            if current != tick:
+                tick = current
+                id, status, sentences, fix = device.state
+                output.send(NMEAClient._cache.get(self._scheduler.timestamp(tick), id, status, sentences, vessel, fix,
+                                                  self._scheduler.real(tick)))
+            delay = output.pump()
+
+
 class NMEAClient(threading.Thread):
-    _clients = ClientSet()
+    _clients = ConnectionTable()  # потоки клиентов, подключение и отключение за O(1)
+    _cache = SentenceCache()  # общий для всех потоков: пакет строится один раз за тик
+    _slow_disconnects = 0
+    _stats_lock = threading.Lock()
 
-    def __init__(self, conn=None, addr=None, rmc=True, gsa=False, status="A", id="GP", *args, **kwargs):
+    def __init__(self, conn=None, addr=None, device=None,
+                 scheduler=None, queue=None, vessel=None, capture=None, metrics=None, faults=None,
+                 *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._vessel = vessel
+        self._capture = capture
+        self._capture_conn = capture.connection() if capture else 0
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._stats = self._metrics.shard()
+        # faults.FaultProfile сервера: у клиента свой генератор искажений или None для чистого потока
+        self._faults = faults.injector(self._stats) if faults else None
+        self._reason = None  # причина отключения, если его инициировал сервер
+        self._scheduler = scheduler
+        self._queue = queue if queue is not None else SendQueue()
+        self._pending = []  # недоотправленные буферы пакета
         self._conn = conn
-        self._addr = addr
+        # Неблокирующая отправка: медленный клиент копит пакеты в своей ограниченной очереди
+        self._conn.setblocking(False)
         self._ip, self._port = addr
-        self.rmc = rmc
-        self.gsa = gsa
-        self.status = status
-        self.id = id
+        self._device = device
         self._err = ""
-        self._lock = threading.RLock()
-        NMEAClient._add_client(addr)
+        self.slot = -1  # индекс в таблице подключений
+        NMEAClient._add_client(self)
         logger.info(NMEAClient._get_total_clients())
 
     @classmethod
-    def _add_client(cls, addr):
-        cls._clients.add(addr)
+    def _add_client(cls, client):
+        cls._clients.add(client)
 
     @classmethod
-    def _del_client(cls, addr):
-        cls._clients.discard(addr)
+    def _del_client(cls, client):
+        cls._clients.remove(client)
 
     @classmethod
     def _get_total_clients(cls):
-        return f"Total clients: {len(cls._clients)} {cls._clients}"
+        return str(cls._clients)
 
-            
-    def toggle_rmc_status(self):
-        with self._lock: # Исключаем гонку потоков. 
-            self.status = "V" if self.status == "A" else "A"
-            logger.debug(f"New status \"{self.status}\" for RMC packet ({self._addr})")
-
-        
-    def _make_nmea_sentence(self):
-        time_t = time.gmtime()
-        hhmmssss = f'{time_t.tm_hour:02d}{time_t.tm_min:02d}{time_t.tm_sec:02d}.000'
-        ddmmyy = time.strftime("%d%m%y", time_t)
-
-        sentences = []
-        if self.rmc:
-            rmc = pynmea2.RMC(self.id, 'RMC', (
-                hhmmssss, self.status, '4916.45', 'N', '12311.12', 'W', '173.8', '231.8', ddmmyy, '005.2', 'W'))
-            sentences.append(str(rmc).strip())
+    @classmethod
+    def _get_slow_clients(cls):
+        queues = [client._queue for client in cls._clients]
+        backlogged = [queue for queue in queues if queue]
+        max_backlog = max((len(queue) for queue in backlogged), default=0)
+        return (f"Slow clients: {len(backlogged)} with backlog (max {max_backlog}), "
+                f"dropped {sum(queue.dropped for queue in queues)}, disconnected {cls._slow_disconnects}")
 
-        if self.gsa:
-            gsa = pynmea2.GSA(self.id, 'GSA', ('A', '3', '10', '16', '18', '20', '26', '27', '', '', '', '', '', '', '4.8', '2.0', '4.3'))
-            sentences.append(str(gsa).strip())
+    def _make_nmea_sentence(self, tick):
+        # Параметры пакета - один кортеж приемника, прочитанный на этом тике
+        id, status, sentences, fix = self._device.state
+        return NMEAClient._cache.get(self._scheduler.timestamp(tick), id, status, sentences, self._vessel, fix,
+                                     self._scheduler.real(tick))
 
-        return "\r\n".join(sentences).encode('ascii') + b'\r\n'
+    def _flush(self):
+        try:
+            while True:
+                if not self._pending:
+                    if not self._queue:
+                        return
+                    self._pending = list(self._queue.get())
+                # Все сообщения пакета одним sendmsg, частичная отправка продолжается со смещения
+                advance_buffers(self._pending, send_buffers(self._conn, self._pending))
+        except BlockingIOError:
+            pass
 
-    def _send_nmea_sentences(self):
-        nmea_sentences = self._make_nmea_sentence()
-        self._conn.sendall(nmea_sentences)
-        logger.debug(f"{self._ip}:{self._port} <-- TX: {nmea_sentences}")
+    def _send_nmea_sentences(self, tick):
+        start = time.perf_counter()
+        payload = self._make_nmea_sentence(tick)
+        # Искажается копия для этого клиента, общий пакет кэша не меняется
+        nmea_sentences = self._faults.nmea(payload) if self._faults is not None else payload
+        if not nmea_sentences:  # тик задержан искажением delay/reorder
+            self._flush()
+            return
+        if self._capture:
+            self._capture.write(self._capture_conn, TX, nmea_sentences)
+        self._flush()
+        dropped = self._queue.dropped
+        if not self._queue.put(nmea_sentences):
+            with NMEAClient._stats_lock:
+                NMEAClient._slow_disconnects += 1
+            self._reason = "slow_consumer"
+            raise ConnectionError("send queue overflow, slow consumer disconnected")
+        if dropped == 0 and self._queue.dropped:
+            logger.warning(f"Client [{self._ip}:{self._port}] is too slow, dropping packets ({self._queue.policy})")
+        self._flush()
+        count_sentences(self._stats, payload)
+        self._stats.observe(SEND_TIME, time.perf_counter() - start)
+        traffic_log.log(logging.DEBUG, "%s:%s <-- TX: %s", self._ip, self._port, TrafficData(nmea_sentences))
 
     def run(self):
         try:
+            tick = None
             while True:
-                timer_start = time.perf_counter()
-                self._send_nmea_sentences()
-                time.sleep(max(INTERVAL_TX_PACKET - (time.perf_counter() - timer_start), 0))
+                # Все клиенты просыпаются по одному общему тику планировщика
+                tick = self._scheduler.wait(tick)
+                self._send_nmea_sentences(tick)
         except Exception as e:
             self._err = e
         finally:
             self._close()
 
     def _close(self):
-        msg = f"Client [{self._ip}:{self._port}] connection closed ({self._err})"
+        msg = f"Client [{self._ip}:{self._port}] connection closed ({self._err}), {self._queue}"
         logger.info(msg)
         self._conn.close()
-        NMEAClient._del_client(self._addr)
+        self._stats.counters[DISCONNECTS[self._reason or ("error" if self._err else "closed")]] += 1
+        self._metrics.retire(self._stats)
+        NMEAClient._del_client(self)
         logger.info(NMEAClient._get_total_clients())
         # Close thread
         sys.exit()
 
 
 def create_parser():
-    parser = argparse.ArgumentParser(description="NMEA protocol emulation of RMC and GSA packages")
+    parser = argparse.ArgumentParser(description="NMEA protocol emulation of RMC, GGA, GSA, GSV, VTG and ZDA packages")
     parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help='Port to run the server on')
     parser.add_argument('-r', '--rmc', action='store_true', help='Include RMC sentences')
     parser.add_argument('-g', '--gsa', action='store_true', help='Include GSA sentences')
+    parser.add_argument('--gga', action='store_true', help='Include GGA sentences')
+    parser.add_argument('--gsv', action='store_true', help='Include GSV sentences (satellites in view, paged)')
+    parser.add_argument('--vtg', action='store_true', help='Include VTG sentences')
+    parser.add_argument('--zda', action='store_true', help='Include ZDA sentences')
     parser.add_argument('-s', '--status', choices=["A", "V"], default="A", help='Status character for RMC sentence')
     parser.add_argument('-i', '--id', choices=["GP", "GN", "GL", "BD", "GA"], default="GP", help='Talker ID')
+    parser.add_argument('-R', '--rate', type=parse_rate, default=DEFAULT_RATE, help='Update rate, Hz (up to 50)')
+    parser.add_argument('-q', '--queue', type=int, default=DEFAULT_LIMIT,
+                        help='Per-client send queue limit, packets')
+    parser.add_argument('--slow-policy', choices=POLICIES, default=DEFAULT_POLICY,
+                        help='What to do when a client send queue is full')
+    parser.add_argument('--vessels', type=int, default=0,
+                        help='Simulate N moving vessels, each client gets the next one (default: fixed position)')
+    parser.add_argument('--route', help='Route file with "lat lon" waypoints in degrees, shared by all vessels')
+    parser.add_argument('--speed', type=float, default=12.0, help='Vessel speed, knots')
+    parser.add_argument('--turn-rate', type=float, default=3.0, help='Vessel turn rate, deg/s')
+    parser.add_argument('--leg', choices=["gc", "rhumb"], default="gc", help='Legs between waypoints: great circle or rhumb line')
+    parser.add_argument('-c', '--config',
+                        help='JSON file with device profiles to serve from one process (async engine only)')
+    parser.add_argument('-u', '--udp', type=parse_destination, action='append', default=[],
+                        help='Also send NMEA over UDP to host[:port] (broadcast, multicast group or unicast), repeatable')
+    parser.add_argument('--udp-ttl', type=int, default=1, help='TTL of multicast UDP datagrams')
+    parser.add_argument('--serial', type=parse_serial, action='append', default=[],
+                        help='Also write NMEA to a new pseudo-terminal or a serial device at the given baud rate: '
+                             '"pty[,baud=4800][,link=PATH]" or "/dev/ttyS0[,baud=38400]", repeatable (Unix only)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Worker processes sharing the port through SO_REUSEPORT')
+    parser.add_argument('-e', '--engine', choices=["async", "thread"], default="async",
+                        help='Server engine: single event loop for all clients or thread per client')
+    parser.add_argument('--log-traffic', type=int, default=TRAFFIC_LOG_LIMIT,
+                        help='Max TX/RX trace records per second, 0 disables tracing')
+    parser.add_argument('--capture', help='Record all client traffic to a binary capture file')
+    parser.add_argument('--replay',
+                        help='Stream a binary capture or a text NMEA log to clients instead of generated sentences '
+                             '(async engine only)')
+    parser.add_argument('--replay-speed', type=parse_speed, default=1.0,
+                        help='Replay speed factor, 0 for maximum speed')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve Prometheus metrics on /metrics and JSON on /metrics.json at this HTTP port')
+    parser.add_argument('--control-port', type=int,
+                        help='Serve the runtime control API (GET/POST /state) on this localhost HTTP port')
+    parser.add_argument('--faults', type=parse_nmea_faults,
+                        help='Inject faults with per-packet probabilities, e.g. checksum=0.01,truncate=0.01,split=0.01,'
+                             'duplicate=0.01,reorder=0.01,delay=0.01')
+    parser.add_argument('--fault-seed', type=int, help='Seed of the fault injector (default: random, logged)')
+    parser.add_argument('--fault-clients', type=parse_fraction, default=1.0,
+                        help='Fraction of clients that receive faults, the rest get clean output')
+    add_clock_arguments(parser)
     return parser
 
 
@@ -165,34 +338,118 @@ def exit_gracefully(signal, frame):
 signal.signal(signal.SIGINT, exit_gracefully)
 
 
-def toggle_rmc_status():
-    thread_list = [thread for thread in threading.enumerate() if thread.name.startswith('NMEAClient')]
-    if thread_list:
-        for thr in thread_list:
-            thr.toggle_rmc_status()
+def is_interactive():
+    """Запуск из терминала: демону (systemd, CI) горячие клавиши и модуль keyboard не нужны."""
+    return os.getppid() != 1 and sys.stdin is not None and sys.stdin.isatty()
 
-def keyhandler():
+
+def keyhandler(callback):
+    global keyboard
+    try:
+        import keyboard
+    except ImportError as e:
+        logger.error(e)
+        return
     try:
-        keyboard.add_hotkey('space', toggle_rmc_status)
+        keyboard.add_hotkey('space', callback)
     except ImportError:
         logger.warning("Module keyboard work only for root user!")
-        
 
-if __name__ == '__main__':
-    if os.getppid() != 1:  # если родительский процесс - не  init/systemd
-        print('Press ESC to exit' if IS_WIN else 'Press CTRL+C to exit')
-        print('Press hotkey Space to change status RMC packet')
-        keyhandler()
+
+def create_fleet(args):
+    if not args.vessels:
+        return None
+    # NumPy нужен только модели движения, поэтому импорт отложенный
+    from trajectory import Fleet, DEFAULT_CENTER, load_route
+    options = dict(speed=args.speed, turn_rate=args.turn_rate, leg=args.leg)
+    if args.route:
+        return Fleet.from_route(args.vessels, load_route(args.route), **options)
+    return Fleet.around(args.vessels, *DEFAULT_CENTER, **options)
+
+
+def create_server(args):
+    fleet = create_fleet(args)
+    devices = None
+    if args.config:
+        devices = load_devices(args.config)
+        if args.engine != "async":
+            raise ValueError("Device profiles (--config) are served by the async engine only")
+        if fleet is None and any(device.position != FIXED for device in devices):
+            raise ValueError("Device profiles with a vessel position source require --vessels")
+    if args.workers > 1 and (args.udp or any(device.udp for device in devices or [])):
+        # Каждый рабочий процесс отправил бы свою копию датаграмм
+        raise ValueError("UDP output is not supported with --workers")
+    if args.workers > 1 and (args.serial or any(device.serial for device in devices or [])):
+        # Каждый рабочий процесс открыл бы свой псевдотерминал или тот же порт
+        raise ValueError("Serial output is not supported with --workers")
+    if args.workers > 1 and args.capture:
+        raise ValueError("Capture is not supported with --workers")
+    if args.workers > 1 and args.metrics_port:
+        # Порт метрик занял бы только один рабочий процесс
+        raise ValueError("Metrics endpoint is not supported with --workers")
+    if args.workers > 1 and args.control_port:
+        # Между рабочими процессами разделяется только статус RMC (горячая клавиша)
+        raise ValueError("Control API is not supported with --workers")
+    replay = None
+    if args.replay:
+        if args.engine != "async":
+            raise ValueError("Replay (--replay) is served by the async engine only")
+        replay = Replay(args.replay, args.replay_speed)
+    capture = CaptureWriter(args.capture) if args.capture else None
+    faults = None
+    if args.faults:
+        faults = FaultProfile(args.faults, args.fault_seed, args.fault_clients)
+        logger.info(faults)
+    clock = create_clock(args)
+    if clock is not None:
+        logger.info(clock)
+    sentences = tuple(name for name in SENTENCES if getattr(args, name.lower()))
+    if args.engine == "async":
+        from asyncNmeaServer import AsyncNMEAServer
+        server = AsyncNMEAServer(name="NMEAServer", daemon=True, port=args.port, reuse_port=args.workers > 1,
+                                 sentences=sentences, status=args.status, id=args.id, rate=args.rate,
+                                 queue_limit=args.queue, slow_policy=args.slow_policy, fleet=fleet,
+                                 devices=devices, udp=args.udp, udp_ttl=args.udp_ttl, serial=args.serial,
+                                 capture=capture, replay=replay, faults=faults, clock=clock)
+        return server, server.toggle_rmc_status
+    server = NMEAServer(name="NMEAServer", daemon=True, port=args.port, reuse_port=args.workers > 1,
+                        sentences=sentences, status=args.status, id=args.id, rate=args.rate,
+                        queue_limit=args.queue, slow_policy=args.slow_policy, fleet=fleet,
+                        udp=args.udp, udp_ttl=args.udp_ttl, serial=args.serial, capture=capture, faults=faults,
+                        clock=clock)
+    return server, server.toggle_rmc_status
+
+
+def main():
     args = create_parser().parse_args()
+    setup_logger()
+    traffic_log.limit = args.log_traffic
+    raise_file_limit()  # каждое подключение - дескриптор
     try:
-        server = NMEAServer(name="NMEAServer", daemon=True, port=args.port, 
-                            rmc=args.rmc, gsa=args.gsa, status=args.status, id=args.id)
+        server, toggle = create_server(args)
+        if args.metrics_port:
+            MetricsServer(server.metrics, args.metrics_port, name="MetricsServer", daemon=True).start()
+        if args.control_port:
+            ControlServer(server.control, args.control_port, name="ControlServer", daemon=True).start()
+        if args.workers > 1:
+            from workers import WorkerPool, share_statuses
+            # Статус RMC в разделяемой памяти, чтобы горячая клавиша действовала на все процессы
+            share_statuses(server.devices)
+            server = WorkerPool(args.workers, server.run, name="NMEAWorkers", daemon=True)
+        if is_interactive():
+            print('Press ESC to exit' if IS_WIN else 'Press CTRL+C to exit')
+            print('Press hotkey Space to change status RMC packet')
+            keyhandler(toggle)
         server.start()
         while server.is_alive():
-            if IS_WIN and keyboard.read_key() == "esc": 
+            if IS_WIN and keyboard is not None and keyboard.read_key() == "esc":
                 sys.exit(0)
             time.sleep(0.1)
     except Exception as e:
         logger.error(e, exc_info=True)
     finally:
-        logger.info("NMEA Server stopped!")
\ No newline at end of file
+        logger.info("NMEA Server stopped!")
+
+
+if __name__ == '__main__':
+    main()
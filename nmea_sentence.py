@@ -0,0 +1,233 @@
+import functools
+import threading
+import time
+from send_queue import Packet
+
+# Поля сообщений: bytes - постоянное значение, None - поле, подставляемое на каждом тике
+RMC_FIELDS = (None, None, None, None, None, None, None, None, None, b'005.2', b'W')  # время, статус, позиция, SOG, COG, дата
+# время, позиция, качество, число спутников, HDOP; высота антенны и превышение геоида постоянные
+GGA_FIELDS = (None, None, None, None, None, None, None, None, b'12.0', b'M', b'-17.0', b'M', b'', b'')
+ZDA_FIELDS = (None, None, None, None, b'00', b'00')  # время, день, месяц, год, часовой пояс
+LINE_END = b'\r\n'
+# Неподвижная позиция по умолчанию: широта, N/S, долгота, E/W, SOG, COG
+DEFAULT_FIX = (b'4916.45', b'N', b'12311.12', b'W', b'173.8', b'231.8')
+# Поддерживаемые сообщения в порядке выдачи внутри пакета
+SENTENCES = ("RMC", "GGA", "GSA", "GSV", "VTG", "ZDA")
+# Сообщения с данными спутников строятся по модели неба (satellites.py)
+SKY_SENTENCES = frozenset(("GGA", "GSA", "GSV"))
+KNOTS_TO_KMH = 1.852
+
+
+def calculate_checksum(data, checksum=0):
+    """Вычисление контрольной суммы NMEA (XOR байтов), с продолжением от checksum"""
+    for byte in data:
+        checksum ^= byte
+    return checksum
+
+
+class SentenceTemplate:
+    """Предкомпилированный шаблон сообщения NMEA.
+
+    Постоянные части хранятся в байтах вместе с их контрольной суммой,
+    на тике в шаблон подставляются только переменные поля и XOR их байтов.
+    """
+
+    def __init__(self, talker, sentence_type, fields):
+        chunks = []
+        chunk = talker.encode('ascii') + sentence_type.encode('ascii')
+        for field in fields:
+            chunk += b','
+            if field is None:
+                chunks.append(chunk)
+                chunk = b''
+            else:
+                chunk += field
+        chunks.append(chunk)
+        self._head = chunks[:-1]
+        self._tail = chunks[-1]
+        self._checksum = 0
+        for chunk in chunks:
+            self._checksum = calculate_checksum(chunk, self._checksum)
+
+    def render(self, *values):
+        checksum = self._checksum
+        parts = [b'$']
+        for chunk, value in zip(self._head, values):
+            parts.append(chunk)
+            parts.append(value)
+            checksum = calculate_checksum(value, checksum)
+        parts.append(self._tail)
+        parts.append(b'*%02X\r\n' % checksum)
+        return b''.join(parts)
+
+
+def format_coord(value, degree_digits, hemispheres):
+    """Координата в градусах -> поле NMEA (d)ddmm.mmmm и полушарие из hemispheres (b'NS' или b'EW')."""
+    hemisphere = hemispheres[:1] if value >= 0 else hemispheres[1:]
+    value = abs(value)
+    degrees = int(value)
+    minutes = round((value - degrees) * 60, 4)
+    if minutes >= 60:
+        degrees += 1
+        minutes = 0.0
+    return b'%0*d%07.4f' % (degree_digits, degrees, minutes), hemisphere
+
+
+def make_fix(lat, lon, sog=0.0, cog=0.0):
+    """Поля RMC (широта, N/S, долгота, E/W, SOG, COG) из градусов, узлов и курса в градусах."""
+    lat, ns = format_coord(lat, 2, b'NS')
+    lon, ew = format_coord(lon, 3, b'EW')
+    return lat, ns, lon, ew, b'%.1f' % sog, b'%.1f' % (round(cog, 1) % 360)
+
+
+def parse_coord(value, hemisphere):
+    """Поле NMEA (d)ddmm.mmmm и полушарие -> градусы (обратное к format_coord)."""
+    point = value.index(b'.') if b'.' in value else len(value)
+    degrees = int(value[:point - 2]) + float(value[point - 2:]) / 60
+    return -degrees if hemisphere in (b'S', b'W') else degrees
+
+
+@functools.lru_cache(maxsize=4096)
+def fix_position(fix):
+    """Широта и долгота поля fix в градусах: позиция наблюдателя для модели неба."""
+    return parse_coord(fix[0], fix[1]), parse_coord(fix[2], fix[3])
+
+
+def build_sentence(talker, sentence_type, fields):
+    """Сообщение из готовых полей с контрольной суммой - для сообщений, которые кэшируются целиком (GSA, GSV, VTG)."""
+    body = talker.encode('ascii') + sentence_type.encode('ascii') + b',' + b','.join(fields)
+    return b'$%s*%02X\r\n' % (body, calculate_checksum(body))
+
+
+def select_sentences(names):
+    """Набор сообщений в порядке выдачи (SENTENCES); неизвестные имена - ValueError."""
+    names = {name.upper() for name in names}
+    unknown = names - set(SENTENCES)
+    if unknown:
+        raise ValueError(f"unsupported sentences {sorted(unknown)}, expected {list(SENTENCES)}")
+    return tuple(name for name in SENTENCES if name in names)
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(talker, sentence_type):
+    fields = {"RMC": RMC_FIELDS, "GGA": GGA_FIELDS, "ZDA": ZDA_FIELDS}[sentence_type]
+    return SentenceTemplate(talker, sentence_type, fields)
+
+
+@functools.lru_cache(maxsize=4096)
+def get_vtg(talker, sog, cog, status):
+    """VTG зависит только от курса, скорости и статуса и строится один раз на их набор."""
+    kmh = b'%.1f' % (float(sog) * KNOTS_TO_KMH)
+    mode = b'A' if status == "A" else b'N'
+    return build_sentence(talker, 'VTG', (cog, b'T', b'', b'M', sog, b'N', kmh, b'K', mode))
+
+
+@functools.lru_cache(maxsize=None)
+def get_sky():
+    """Общая модель неба процесса; NumPy нужен только ей, поэтому импорт отложенный."""
+    from satellites import Sky
+    return Sky()
+
+
+def make_nmea_buffers(id="GP", status="A", sentences=("RMC",), timestamp=None, fix=DEFAULT_FIX):
+    """Формирование пакета NMEA, общее для всех движков сервера.
+
+    Пакет - кортеж буферов (send_queue.Packet), по одному на сообщение с концом
+    строки: он отправляется векторно (sendmsg/writelines) без склейки в один bytes.
+    sentences - имена сообщений в порядке SENTENCES (select_sentences).
+    timestamp - время UTC в секундах от эпохи, доли секунды попадают в поле времени RMC/GGA/ZDA.
+    fix - поля позиции, SOG и COG (см. DEFAULT_FIX и trajectory.Fleet.fix).
+    На каждом тике заново собираются только RMC, GGA и ZDA с полем времени;
+    GSA и GSV берутся готовыми из вида неба (satellites.SkyView), VTG - из кэша get_vtg.
+    """
+    if timestamp is None:
+        timestamp = time.time()
+
+    seconds, ms = divmod(round(timestamp * 1000), 1000)
+    time_t = time.gmtime(seconds)
+    hhmmssss = b'%02d%02d%02d.%03d' % (time_t.tm_hour, time_t.tm_min, time_t.tm_sec, ms)
+    sky = None
+    if not SKY_SENTENCES.isdisjoint(sentences):
+        sky = get_sky().view(timestamp, *fix_position(fix))
+
+    buffers = []
+    for name in sentences:
+        if name == "RMC":
+            ddmmyy = b'%02d%02d%02d' % (time_t.tm_mday, time_t.tm_mon, time_t.tm_year % 100)
+            buffers.append(get_template(id, 'RMC').render(hhmmssss, status.encode('ascii'), *fix, ddmmyy))
+        elif name == "GGA":
+            used, hdop = sky.solution(id)
+            quality = b'1' if status == "A" else b'0'
+            buffers.append(get_template(id, 'GGA').render(hhmmssss, *fix[:4], quality, used, hdop))
+        elif name == "GSA":
+            buffers.extend(sky.gsa(id))
+        elif name == "GSV":
+            buffers.extend(sky.gsv(id))
+        elif name == "VTG":
+            buffers.append(get_vtg(id, fix[4], fix[5], status))
+        elif name == "ZDA":
+            buffers.append(get_template(id, 'ZDA').render(
+                hhmmssss, b'%02d' % time_t.tm_mday, b'%02d' % time_t.tm_mon, b'%04d' % time_t.tm_year))
+
+    return Packet(buffers or (LINE_END,))
+
+
+def make_nmea_sentence(*args, **kwargs):
+    """Пакет NMEA одним объектом bytes (см. make_nmea_buffers)."""
+    return b''.join(make_nmea_buffers(*args, **kwargs))
+
+
+class SentenceCache:
+    """Кэш пакетов NMEA текущего тика.
+
+    Ключ - (talker ID, статус, набор сообщений, источник позиции).
+    Клиенты с неподвижной позицией (vessel None) получают поля fix.
+    Каждый уникальный пакет строится один раз за тик, клиенты получают один
+    и тот же кортеж буферов (make_nmea_buffers). Если задан fleet, смена тика продвигает модель
+    движения, а vessel выбирает судно как источник позиции.
+
+    Порядок тиков задает real - реальное время тика (TickScheduler.real),
+    без него - timestamp. Вызов с прошлым тиком (поток клиента опоздал)
+    получает пакет текущего тика: кэш и модель движения назад не
+    откатываются. Модельное время при этом может идти назад (скачок часов).
+    """
+
+    def __init__(self, fleet=None):
+        self.fleet = fleet
+        self._tick = None
+        self._real = None
+        self._payloads = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, timestamp, id="GP", status="A", sentences=("RMC",), vessel=None, fix=DEFAULT_FIX, real=None):
+        key = (id, status, sentences, vessel, fix)
+        if real is None:
+            real = timestamp
+        with self._lock:
+            if self._real is None or real > self._real:
+                self._real = real
+                self._tick = timestamp
+                self._payloads = {}
+                if self.fleet is not None:
+                    self.fleet.step(timestamp)
+            else:
+                timestamp = self._tick
+            payload = self._payloads.get(key)
+            if payload is None:
+                self.misses += 1
+                if vessel is not None:
+                    fix = self.fleet.fix(vessel)
+                payload = make_nmea_buffers(id, status, sentences, timestamp, fix)
+                self._payloads[key] = payload
+            else:
+                self.hits += 1
+        return payload
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self):
+        return f"Sentence cache: hits {self.hits}, builds {self.misses}, hit ratio {self.hit_ratio():.1%}"
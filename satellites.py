@@ -0,0 +1,216 @@
+import math
+import threading
+import numpy as np
+from nmea_sentence import build_sentence
+
+MU = 398600.4418  # км^3/с^2, гравитационный параметр Земли
+EARTH_RADIUS = 6371.0  # км
+EARTH_ROTATION = 7.2921151467e-5  # рад/с
+ELEVATION_MASK = 5.0  # град, ниже спутник не виден
+SKY_INTERVAL = 30.0  # sec, за это время спутник смещается по небу не больше чем на ~0.3 град
+SKY_CELL = 0.1  # град, ячейка позиции наблюдателя (~11 км), внутри нее вид неба общий
+MAX_USED = 12  # спутников системы в решении (поля PRN сообщения GSA)
+GSV_SATELLITES = 4  # спутников в одном сообщении GSV
+MULTI_GNSS = "GN"
+# Talker ID системы: плоскостей, спутников в плоскости, большая полуось (км), наклонение (град), первый номер NMEA
+CONSTELLATIONS = {
+    "GP": (6, 5, 26560.0, 55.0, 1),  # GPS
+    "GL": (3, 8, 25510.0, 64.8, 65),  # ГЛОНАСС, номера NMEA 65-96
+    "GA": (3, 8, 29600.0, 56.0, 1),  # Galileo
+    "BD": (3, 8, 27900.0, 55.0, 1),  # BeiDou, только MEO
+}
+SYSTEMS = tuple(CONSTELLATIONS)
+
+
+def _build_orbits(seed=0):
+    """Круговые орбиты созвездий Walker: массивы на все спутники сразу."""
+    systems, prns, axes, inclinations, raans, anomalies = [], [], [], [], [], []
+    for index, (talker, (planes, per_plane, axis, inclination, first)) in enumerate(CONSTELLATIONS.items()):
+        total = planes * per_plane
+        for number in range(total):
+            plane, slot = divmod(number, per_plane)
+            systems.append(index)
+            prns.append(first + number)
+            axes.append(axis)
+            inclinations.append(inclination)
+            raans.append(plane * 360 / planes + index * 17)
+            # Сдвиг фазы между плоскостями, чтобы спутники соседних плоскостей не шли строем
+            anomalies.append(slot * 360 / per_plane + plane * 360 / total + index * 29)
+    axes = np.array(axes)
+    rng = np.random.default_rng(seed)
+    return {
+        "system": np.array(systems),
+        "prn": np.array(prns),
+        "axis": axes,
+        "motion": np.sqrt(MU / axes ** 3),  # рад/с
+        "inclination": np.radians(inclinations),
+        "raan": np.radians(raans),
+        "anomaly": np.radians(anomalies),
+        "snr_offset": rng.uniform(-4, 4, len(prns)),  # постоянная поправка SNR спутника, дБГц
+    }
+
+
+class SkyView:
+    """Вид неба в точке на момент времени: видимые спутники, решение и готовые GSA/GSV.
+
+    Сообщения строятся при первом запросе для talker ID и хранятся до
+    пересчета геометрии, поэтому на тике вид неба - только поиск в словаре.
+    """
+
+    __slots__ = ("_system", "_prn", "_elevation", "_azimuth", "_snr", "_los", "_visible", "_used", "_cache")
+
+    def __init__(self, system, prn, elevation, azimuth, snr, los):
+        self._system = system
+        self._prn = prn
+        self._elevation = elevation
+        self._azimuth = azimuth
+        self._snr = snr
+        self._los = los  # единичные векторы на спутники в ENU
+        order = np.argsort(-elevation)
+        self._visible = {}
+        self._used = {}
+        for index, talker in enumerate(SYSTEMS):
+            visible = order[system[order] == index]
+            self._visible[talker] = visible[np.argsort(prn[visible], kind='stable')]
+            self._used[talker] = visible[:MAX_USED]  # самые высокие спутники
+        self._cache = {}
+
+    @staticmethod
+    def systems(talker):
+        return SYSTEMS if talker == MULTI_GNSS else (talker,)
+
+    def _cached(self, kind, talker, build):
+        key = (kind, talker)
+        value = self._cache.get(key)
+        if value is None:
+            value = self._cache[key] = build(talker)
+        return value
+
+    def dop(self, talker):
+        """(PDOP, HDOP, VDOP) решения по спутникам систем talker; пустой кортеж, если спутников меньше 4."""
+        return self._cached("dop", talker, self._dop)
+
+    def _dop(self, talker):
+        used = np.concatenate([self._used[system] for system in self.systems(talker)])
+        if len(used) < 4:
+            return ()
+        geometry = np.column_stack((-self._los[used], np.ones(len(used))))
+        try:
+            q = np.linalg.inv(geometry.T @ geometry)
+        except np.linalg.LinAlgError:
+            return ()
+        return (math.sqrt(q[0, 0] + q[1, 1] + q[2, 2]), math.sqrt(q[0, 0] + q[1, 1]), math.sqrt(q[2, 2]))
+
+    def solution(self, talker):
+        """Поля GGA: число спутников в решении и HDOP."""
+        return self._cached("solution", talker, self._solution)
+
+    def _solution(self, talker):
+        used = sum(len(self._used[system]) for system in self.systems(talker))
+        dop = self.dop(talker)
+        return b'%02d' % used, b'%.1f' % dop[1] if dop else b''
+
+    def gsa(self, talker):
+        """GSA по системам talker: одно сообщение, для GN - по одному на систему."""
+        return self._cached("gsa", talker, self._gsa)
+
+    def _gsa(self, talker):
+        dop = self.dop(talker)
+        mode = b'3' if dop else b'1'
+        dops = tuple(b'%.1f' % value for value in dop) if dop else (b'', b'', b'')
+        sentences = []
+        for system in self.systems(talker):
+            prns = [b'%02d' % prn for prn in self._prn[self._used[system]].tolist()]
+            prns += [b''] * (MAX_USED - len(prns))
+            sentences.append(build_sentence(talker, 'GSA', (b'A', mode, *prns, *dops)))
+        return tuple(sentences)
+
+    def gsv(self, talker):
+        """Многостраничные GSV видимых спутников, talker ID каждой системы свой."""
+        return self._cached("gsv", talker, self._gsv)
+
+    def _gsv(self, talker):
+        sentences = []
+        for system in self.systems(talker):
+            visible = self._visible[system]
+            elevations = self._elevation[visible].round().astype(int).tolist()
+            azimuths = (self._azimuth[visible].round() % 360).astype(int).tolist()
+            fields = [b'%02d,%02d,%03d,%02d' % satellite
+                      for satellite in zip(self._prn[visible].tolist(), elevations, azimuths,
+                                           self._snr[visible].tolist())]
+            pages = max(math.ceil(len(fields) / GSV_SATELLITES), 1)
+            for page in range(pages):
+                head = (b'%d' % pages, b'%d' % (page + 1), b'%02d' % len(fields))
+                satellites = fields[page * GSV_SATELLITES:(page + 1) * GSV_SATELLITES]
+                sentences.append(build_sentence(system, 'GSV', head + tuple(satellites)))
+        return tuple(sentences)
+
+
+class Sky:
+    """Модель неба: угол места, азимут и SNR всех спутников всех систем одним векторным расчетом.
+
+    Геометрия пересчитывается, только когда она заметно меняется: вид
+    неба кэшируется на интервал SKY_INTERVAL для ячейки позиции SKY_CELL,
+    поэтому тысячи клиентов и 10 Гц стоят одного расчета раз в 30 секунд
+    на каждую ячейку, где есть наблюдатели.
+    """
+
+    def __init__(self, interval=SKY_INTERVAL, cell=SKY_CELL, mask=ELEVATION_MASK, seed=0):
+        self.interval = interval
+        self.cell = cell
+        self.mask = mask
+        self._orbits = _build_orbits(seed)
+        self._lock = threading.Lock()
+        self._bucket = None
+        self._views = {}
+        self.computed = 0
+
+    def positions(self, timestamp):
+        """Координаты спутников в ECEF (км) на момент timestamp, массив (N, 3)."""
+        orbits = self._orbits
+        u = orbits["anomaly"] + orbits["motion"] * timestamp
+        x, y = orbits["axis"] * np.cos(u), orbits["axis"] * np.sin(u)
+        cos_i, sin_i = np.cos(orbits["inclination"]), np.sin(orbits["inclination"])
+        # Поворот по наклонению и долготе восходящего узла с учетом вращения Земли
+        node = orbits["raan"] - (EARTH_ROTATION * timestamp) % (2 * math.pi)
+        cos_node, sin_node = np.cos(node), np.sin(node)
+        return np.column_stack((x * cos_node - y * cos_i * sin_node,
+                                x * sin_node + y * cos_i * cos_node,
+                                y * sin_i))
+
+    def compute(self, timestamp, lat, lon):
+        """Расчет вида неба без кэша: все спутники одной операцией над массивами."""
+        phi, lam = math.radians(lat), math.radians(lon)
+        sin_phi, cos_phi, sin_lam, cos_lam = math.sin(phi), math.cos(phi), math.sin(lam), math.cos(lam)
+        observer = EARTH_RADIUS * np.array((cos_phi * cos_lam, cos_phi * sin_lam, sin_phi))
+        delta = self.positions(timestamp) - observer
+        enu = delta @ np.array(((-sin_lam, -sin_phi * cos_lam, cos_phi * cos_lam),
+                                (cos_lam, -sin_phi * sin_lam, cos_phi * sin_lam),
+                                (0.0, cos_phi, sin_phi)))
+        los = enu / np.linalg.norm(enu, axis=1)[:, None]
+        elevation = np.degrees(np.arcsin(los[:, 2]))
+        visible = elevation >= self.mask
+        azimuth = np.degrees(np.arctan2(los[:, 0], los[:, 1])) % 360
+        # Сигнал сильнее у высоких спутников, у каждого спутника своя постоянная поправка
+        snr = np.clip(np.round(20 + 30 * np.sin(np.radians(elevation)) + self._orbits["snr_offset"]), 15, 50)
+        orbits = self._orbits
+        return SkyView(orbits["system"][visible], orbits["prn"][visible], elevation[visible], azimuth[visible],
+                       snr[visible].astype(int), los[visible])
+
+    def view(self, timestamp, lat, lon):
+        """Вид неба из кэша: пересчет при смене интервала времени или ячейки позиции."""
+        bucket = int(timestamp // self.interval)
+        cell = (round(lat / self.cell), round(lon / self.cell))
+        with self._lock:
+            if bucket != self._bucket:
+                self._bucket = bucket
+                self._views = {}
+            view = self._views.get(cell)
+            if view is None:
+                self.computed += 1
+                view = self._views[cell] = self.compute(bucket * self.interval,
+                                                        cell[0] * self.cell, cell[1] * self.cell)
+        return view
+
+    def __str__(self):
+        return f"Sky model: {len(self._orbits['prn'])} satellites, {self.computed} geometry updates"
@@ -0,0 +1,93 @@
+import functools
+import socket
+from collections import deque
+
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+DEFAULT_POLICY = DROP_OLDEST
+DEFAULT_LIMIT = 10  # пакетов (тиков)
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")  # нет в Windows
+
+
+class Packet(tuple):
+    """Пакет тика: кортеж буферов для sendmsg/writelines, общий для всех клиентов.
+
+    joined - те же байты одним bytes для путей без векторной записи
+    (transport.write, sendto). Склеивается один раз на пакет при первом
+    обращении, а не для каждого клиента.
+    """
+
+    @functools.cached_property
+    def joined(self):
+        return b''.join(self)
+
+
+def join_buffers(buffers):
+    """Пакет одним bytes: готовая склейка Packet или склейка кортежа (например, искаженного faults)."""
+    if isinstance(buffers, Packet):
+        return buffers.joined
+    return b''.join(buffers)
+
+
+def send_buffers(sock, buffers):
+    """Отправка списка буферов одним системным вызовом sendmsg, без склейки в user space."""
+    if HAS_SENDMSG:
+        return sock.sendmsg(buffers)
+    return sock.send(join_buffers(buffers))
+
+
+def advance_buffers(buffers, sent):
+    """Убирает из списка buffers первые sent отправленных байт (частичная отправка)."""
+    while sent:
+        head = buffers[0]
+        if sent < len(head):
+            buffers[0] = memoryview(head)[sent:]
+            return
+        sent -= len(head)
+        del buffers[0]
+
+
+class SendQueue:
+    """Ограниченная очередь отправки одного клиента.
+
+    Медленный потребитель копит пакеты только в своей очереди. При
+    переполнении по политике отбрасывается самый старый или новый пакет,
+    либо put() возвращает False и клиента нужно отключить. Сама очередь
+    (deque, около 760 байт) создается при первом пакете: быстрые и
+    простаивающие клиенты ее не заводят.
+    """
+
+    __slots__ = ("limit", "policy", "dropped", "max_backlog", "_items")
+
+    def __init__(self, limit=DEFAULT_LIMIT, policy=DEFAULT_POLICY):
+        self.limit = limit
+        self.policy = policy
+        self.dropped = 0
+        self.max_backlog = 0
+        self._items = None
+
+    def __len__(self):
+        return len(self._items) if self._items is not None else 0
+
+    def put(self, payload):
+        if self._items is None:
+            self._items = deque()
+        if len(self._items) >= self.limit:
+            if self.policy == DISCONNECT:
+                return False
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return True
+            self._items.popleft()
+        self._items.append(payload)
+        if len(self._items) > self.max_backlog:
+            self.max_backlog = len(self._items)
+        return True
+
+    def get(self):
+        return self._items.popleft()
+
+    def __str__(self):
+        return f"backlog {len(self)} (max {self.max_backlog}), dropped {self.dropped}"
@@ -0,0 +1,138 @@
+import argparse
+import logging
+import os
+import time
+from send_queue import SendQueue, DROP_OLDEST, advance_buffers
+
+# Общий логгер сервиса, обработчики настраивает setup_logger() в скрипте сервера
+logger = logging.getLogger("config_log")
+
+PTY = "pty"  # новая пара псевдотерминалов вместо файла устройства
+DEFAULT_BAUD = 4800  # стандартная скорость NMEA 0183
+BAUD_RATES = (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200, 230400)
+BITS_PER_BYTE = 10  # 8N1: старт, 8 бит данных, стоп
+PACING_INTERVAL = 0.01  # sec, шаг выдачи байт в линию
+SERIAL_QUEUE = 4  # пакетов: линия медленнее генератора теряет старые тики, как настоящий приемник
+ERROR_LOG_EVERY = 1000  # не засорять лог при ошибках записи
+
+
+def parse_serial(value):
+    """Последовательный вывод "pty[,baud=4800][,link=/tmp/gps0]" или "/dev/ttyUSB0[,baud=38400]" -> (путь, скорость, ссылка)."""
+    path, *options = value.split(',')
+    baud, link = DEFAULT_BAUD, None
+    for option in options:
+        name, _, option_value = option.partition('=')
+        if name == "baud":
+            try:
+                baud = int(option_value)
+            except ValueError:
+                baud = None
+            if baud not in BAUD_RATES:
+                raise argparse.ArgumentTypeError(f"baud must be one of {BAUD_RATES}: {value}")
+        elif name == "link" and path == PTY and option_value:
+            link = option_value
+        else:
+            raise argparse.ArgumentTypeError(f"invalid serial output option {option!r}: {value}")
+    if not path:
+        raise argparse.ArgumentTypeError(f"invalid serial output: {value}")
+    return path, baud, link
+
+
+def _configure(fd, baud):
+    """Сырой режим (без замены CR/LF и эха) и скорость линии; termios есть только в Unix."""
+    import termios
+    import tty
+    tty.setraw(fd)
+    attributes = termios.tcgetattr(fd)
+    speed = getattr(termios, f"B{baud}")
+    attributes[4] = attributes[5] = speed  # ispeed, ospeed
+    termios.tcsetattr(fd, termios.TCSANOW, attributes)
+
+
+class SerialOutput:
+    """Вывод NMEA в псевдотерминал или файл последовательного порта со скоростью линии baud.
+
+    Запись неблокирующая и порциями по PACING_INTERVAL: в линию уходит
+    не больше baud / 10 байт в секунду, как по настоящему кабелю, даже
+    если это псевдотерминал, для которого ядро скорость не ограничивает.
+    Пакеты, которые линия не успевает передать, копятся в короткой
+    очереди, старые отбрасываются. Движок вызывает send() на тике и
+    pump() до тех пор, пока тот возвращает задержку до следующей порции.
+    """
+
+    def __init__(self, path=PTY, baud=DEFAULT_BAUD, link=None):
+        self.path = path
+        self.baud = baud
+        self.link = link
+        self.sent = 0
+        self.blocked = 0  # записей, не принятых драйвером (EAGAIN)
+        self.errors = 0
+        self._rate = baud / BITS_PER_BYTE  # байт/с
+        self._chunk = max(1, round(self._rate * PACING_INTERVAL))
+        self._queue = SendQueue(SERIAL_QUEUE, DROP_OLDEST)
+        self._pending = []  # недоотправленные буферы текущего пакета
+        self._free_at = 0.0  # момент monotonic, когда линия освободится
+        self._slave = None
+        if path == PTY:
+            self._fd, self._slave = os.openpty()
+            # Потребитель читает из ведомой стороны; она остается открытой, чтобы настройки и буфер жили без него
+            _configure(self._slave, baud)
+            self.path = os.ttyname(self._slave)
+            if link:
+                if os.path.islink(link):
+                    os.unlink(link)  # ссылка от прошлого запуска
+                os.symlink(self.path, link)
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+            _configure(self._fd, baud)
+        os.set_blocking(self._fd, False)
+
+    @property
+    def busy(self):
+        """Есть данные для линии: движок должен продолжать вызывать pump()."""
+        return bool(self._pending or self._queue)
+
+    def send(self, buffers):
+        """Постановка пакета тика (кортеж буферов) в очередь линии."""
+        self._queue.put(buffers)
+
+    def pump(self, now=None):
+        """Запись следующей порции, если линия свободна. Возвращает задержку до следующего вызова или None."""
+        if now is None:
+            now = time.monotonic()
+        if now < self._free_at:
+            return self._free_at - now
+        if not self._pending:
+            if not self._queue:
+                return None
+            self._pending = list(self._queue.get())
+        head = self._pending[0]
+        try:
+            written = os.write(self._fd, head[:self._chunk])
+        except BlockingIOError:
+            # Буфер драйвера полон (никто не читает псевдотерминал): повтор через шаг
+            self.blocked += 1
+            return PACING_INTERVAL
+        except OSError as e:
+            self.errors += 1
+            if self.errors % ERROR_LOG_EVERY == 1:
+                logger.warning(f"Serial write to {self.path} failed ({e}), errors {self.errors}")
+            self._pending = []
+            return PACING_INTERVAL if self._queue else None
+        advance_buffers(self._pending, written)
+        self.sent += written
+        # Линия занята на время передачи записанных байт
+        self._free_at = max(self._free_at, now) + written / self._rate
+        return self._free_at - now if self.busy else None
+
+    def close(self):
+        os.close(self._fd)
+        if self._slave is not None:
+            os.close(self._slave)
+            if self.link and os.path.islink(self.link):
+                os.unlink(self.link)
+
+    def __str__(self):
+        link = f" ({self.link})" if self.link else ""
+        return (f"Serial {self.path}{link} {self.baud} baud: sent {self.sent} bytes, {self._queue}, "
+                f"blocked {self.blocked}, errors {self.errors}")
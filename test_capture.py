@@ -0,0 +1,32 @@
+"""Воспроизведение текстовых логов NMEA: пачки и их время."""
+import itertools
+from capture import Replay, MAX_BURST, LOOP_GAP
+
+AIVDM = b'!AIVDM,1,1,,A,13aEOK?P00PD2wVMdLDRhgvL289?,0*26\r\n'
+
+
+def _write(tmp_path, lines):
+    path = tmp_path / "track.nmea"
+    path.write_bytes(b''.join(lines))
+    return str(path)
+
+
+def test_long_untimed_log(tmp_path):
+    # Лог только из AIS: ни одного сообщения со временем, пачки ограничены MAX_BURST
+    replay = Replay(_write(tmp_path, [AIVDM] * (MAX_BURST * 2 + 10)), speed=0)
+    bursts = list(itertools.islice(replay.bursts(), 6))
+    assert [len(buffers) for _, buffers in bursts[:3]] == [MAX_BURST, MAX_BURST, 10]
+    assert [timestamp for timestamp, _ in bursts] == [0.0] * 3 + [LOOP_GAP] * 3
+    assert all(buffer == AIVDM for _, buffers in bursts for buffer in buffers)
+
+
+def test_untimed_prefix_before_first_fix(tmp_path):
+    lines = [AIVDM] * (MAX_BURST + 5) + [
+        b'$GPRMC,120000.00,A,4916.45,N,12311.12,W,000.5,054.7,191194,020.3,E*68\r\n',
+        AIVDM,
+        b'$GPRMC,120001.00,A,4916.45,N,12311.12,W,000.5,054.7,191194,020.3,E*69\r\n',
+    ]
+    replay = Replay(_write(tmp_path, lines), speed=1)
+    bursts = list(itertools.islice(replay.bursts(), 4))
+    assert [timestamp for timestamp, _ in bursts] == [0.0, 0.0, 1.0, 1.0 + LOOP_GAP]
+    assert [len(buffers) for _, buffers in bursts] == [MAX_BURST, 7, 1, MAX_BURST]
@@ -0,0 +1,130 @@
+"""Побайтовое совпадение шаблонного кодировщика NMEA с pynmea2 и эталонными строками."""
+import calendar
+import time
+import pytest
+from nmea_sentence import (SentenceCache, SENTENCES, DEFAULT_FIX, get_template, make_nmea_buffers,
+                           make_fix, RMC_FIELDS, GGA_FIELDS, ZDA_FIELDS)
+
+try:
+    import pynmea2  # нужен только тестам (requirements-dev.txt), сервис кодирует сообщения сам
+except ImportError:
+    pynmea2 = None
+needs_pynmea2 = pytest.mark.skipif(pynmea2 is None, reason="pynmea2 is not installed (requirements-dev.txt)")
+
+TALKERS = ("GP", "GN", "GL", "BD", "GA")
+STATUSES = ("A", "V")
+# Переходы секунды, минуты, суток и года с округлением долей до миллисекунд
+TIMESTAMPS = (
+    calendar.timegm((2016, 12, 31, 23, 59, 59)) + 0.9,
+    calendar.timegm((2016, 12, 31, 23, 59, 59)) + 0.9996,  # округляется в 00:00:00.000 следующего года
+    calendar.timegm((2017, 1, 1, 0, 0, 0)),
+    calendar.timegm((2024, 2, 28, 23, 59, 59)) + 0.5,
+    calendar.timegm((2024, 2, 29, 12, 30, 59)) + 0.9994,
+)
+
+
+def _fields(template_fields, values):
+    """Поля сообщения для pynmea2: переменные из values, постоянные из шаблона."""
+    values = iter(values)
+    return [(next(values) if field is None else field).decode('ascii') for field in template_fields]
+
+
+def _expected_time(timestamp):
+    seconds, ms = divmod(round(timestamp * 1000), 1000)
+    t = time.gmtime(seconds)
+    return t, '%02d%02d%02d.%03d' % (t.tm_hour, t.tm_min, t.tm_sec, ms)
+
+
+def _pynmea2(sentence):
+    return (str(sentence) + '\r\n').encode('ascii')
+
+
+@needs_pynmea2
+@pytest.mark.parametrize("talker", TALKERS)
+@pytest.mark.parametrize("status", STATUSES)
+@pytest.mark.parametrize("timestamp", TIMESTAMPS)
+def test_rmc_gga_zda_match_pynmea2(talker, status, timestamp):
+    t, hhmmss = _expected_time(timestamp)
+    fix = tuple(field.decode('ascii') for field in DEFAULT_FIX)
+    ddmmyy = '%02d%02d%02d' % (t.tm_mday, t.tm_mon, t.tm_year % 100)
+    rmc, gga, zda = make_nmea_buffers(talker, status, ("RMC", "GGA", "ZDA"), timestamp)
+
+    assert rmc == _pynmea2(pynmea2.RMC(talker, 'RMC', (hhmmss, status) + fix + (ddmmyy, '005.2', 'W')))
+    parsed = pynmea2.parse(gga.decode('ascii'), check=True)
+    used, hdop = parsed.num_sats, parsed.horizontal_dil  # число спутников и HDOP задает модель неба
+    quality = '1' if status == "A" else '0'
+    assert gga == _pynmea2(pynmea2.GGA(talker, 'GGA', (hhmmss,) + fix[:4] + (quality, used, hdop)
+                                       + ('12.0', 'M', '-17.0', 'M', '', '')))
+    assert zda == _pynmea2(pynmea2.ZDA(talker, 'ZDA', (hhmmss, '%02d' % t.tm_mday, '%02d' % t.tm_mon,
+                                                       '%04d' % t.tm_year, '00', '00')))
+
+
+@needs_pynmea2
+@pytest.mark.parametrize("talker", TALKERS)
+@pytest.mark.parametrize("status", STATUSES)
+def test_full_epoch_reencodes_identically(talker, status):
+    # Каждое сообщение полной эпохи разбирается pynmea2 с проверкой суммы и собирается им обратно байт в байт
+    payload = make_nmea_buffers(talker, status, SENTENCES, TIMESTAMPS[0], make_fix(59.9386, 30.3141, 12.0, 45.0))
+    assert len(payload) > 5
+    for line in payload:
+        assert line.endswith(b'\r\n')
+        assert _pynmea2(pynmea2.parse(line.decode('ascii'), check=True)) == line
+
+
+@needs_pynmea2
+def test_templates_match_field_layout():
+    values = (b'120000.000', b'A', *DEFAULT_FIX, b'010117')
+    assert get_template("GP", "RMC").render(*values) == _pynmea2(
+        pynmea2.RMC("GP", "RMC", _fields(RMC_FIELDS, values)))
+    values = (b'120000.000', *DEFAULT_FIX[:4], b'1', b'08', b'0.9')
+    assert get_template("GN", "GGA").render(*values) == _pynmea2(
+        pynmea2.GGA("GN", "GGA", _fields(GGA_FIELDS, values)))
+    values = (b'120000.000', b'01', b'01', b'2017')
+    assert get_template("GL", "ZDA").render(*values) == _pynmea2(
+        pynmea2.ZDA("GL", "ZDA", _fields(ZDA_FIELDS, values)))
+
+
+def test_golden_rollover():
+    # Эталон: 31.12.2016 23:59:59.9996 округляется в полночь нового года
+    rmc, zda = make_nmea_buffers("GN", "A", ("RMC", "ZDA"), TIMESTAMPS[1])
+    assert rmc == b'$GNRMC,000000.000,A,4916.45,N,12311.12,W,173.8,231.8,010117,005.2,W*7A\r\n'
+    assert zda == b'$GNZDA,000000.000,01,01,2017,00,00*4C\r\n'
+    rmc, = make_nmea_buffers("GP", "V", ("RMC",), TIMESTAMPS[0])
+    assert rmc == b'$GPRMC,235959.900,V,4916.45,N,12311.12,W,173.8,231.8,311216,005.2,W*7B\r\n'
+
+
+def test_cache_matches_direct_encoding():
+    cache = SentenceCache()
+    for timestamp in TIMESTAMPS:
+        for talker in TALKERS:
+            for status in STATUSES:
+                payload = cache.get(timestamp, talker, status, SENTENCES)
+                assert payload == make_nmea_buffers(talker, status, SENTENCES, timestamp)
+                assert cache.get(timestamp, talker, status, SENTENCES) is payload
+                # Склейка для transport.write строится один раз на пакет
+                assert payload.joined == b''.join(payload) and payload.joined is payload.joined
+
+
+def test_late_caller_does_not_rewind_fleet():
+    from trajectory import Fleet, DEFAULT_CENTER
+    start = TIMESTAMPS[2]
+    steady = Fleet.around(3, *DEFAULT_CENTER, seed=1)
+    late = Fleet.around(3, *DEFAULT_CENTER, seed=1)
+    steady_cache, late_cache = SentenceCache(steady), SentenceCache(late)
+    for tick in range(1, 4):
+        steady_cache.get(start + tick, vessel=0)
+        late_cache.get(start + tick, vessel=0)
+        # Поток клиента опоздал и пришел с временем прошлого тика: пакет текущего тика, модель не откатывается
+        assert late_cache.get(start + tick - 1, vessel=1) == late_cache.get(start + tick, vessel=1)
+    steady_cache.get(start + 4, vessel=0)
+    late_cache.get(start + 4, vessel=0)
+    assert late.fix(0) == steady.fix(0) and late.fix(1) == steady.fix(1)
+
+
+def test_real_time_orders_ticks_across_clock_jumps():
+    # Модельное время тика ушло назад (скачок часов), реальное растет: пакет строится заново
+    cache = SentenceCache()
+    ahead = cache.get(TIMESTAMPS[2], real=100.0)
+    behind = cache.get(TIMESTAMPS[0], real=101.0)
+    assert behind == make_nmea_buffers(timestamp=TIMESTAMPS[0]) != ahead
+    assert cache.get(TIMESTAMPS[2], real=100.0) is behind
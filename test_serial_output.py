@@ -0,0 +1,67 @@
+"""Последовательный вывод через псевдотерминал: кадры NMEA и скорость линии."""
+import argparse
+import os
+import sys
+import time
+import pytest
+from nmea_sentence import make_nmea_buffers
+from serial_output import SerialOutput, parse_serial, PTY, DEFAULT_BAUD, SERIAL_QUEUE, BITS_PER_BYTE
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="local ptys are tested on Linux")
+
+BAUD = 2400  # 240 байт/с: пакеты теста идут по линии ~1.5 с
+
+
+def _drain(fd, received):
+    try:
+        while True:
+            received.extend(os.read(fd, 4096))
+    except BlockingIOError:
+        pass
+
+
+def test_parse_serial(tmp_path):
+    link = str(tmp_path / "gps0")
+    assert parse_serial("pty") == (PTY, DEFAULT_BAUD, None)
+    assert parse_serial(f"pty,baud=9600,link={link}") == (PTY, 9600, link)
+    assert parse_serial("/dev/ttyUSB0,baud=38400") == ("/dev/ttyUSB0", 38400, None)
+    for value in ("pty,baud=1234", "pty,parity=N", "/dev/ttyS0,link=/tmp/x", ",baud=4800"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_serial(value)
+
+
+def test_pty_framing_and_rate(tmp_path):
+    link = str(tmp_path / "gps0")
+    output = SerialOutput(PTY, BAUD, link)
+    try:
+        # Потребитель открывает ведомую сторону по ссылке, как настоящий приемник
+        reader = os.open(link, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK)
+        packets = [make_nmea_buffers("GP", "A", ("RMC", "ZDA"), 1483228800 + n) for n in range(SERIAL_QUEUE)]
+        expected = b''.join(b''.join(packet) for packet in packets)
+        for packet in packets:
+            output.send(packet)
+        received = bytearray()
+        first = last = None
+        start = time.monotonic()
+        while output.busy or len(received) < len(expected):
+            assert time.monotonic() - start < len(expected) / (BAUD / BITS_PER_BYTE) * 2 + 2, "output stalled"
+            delay = output.pump()
+            size = len(received)
+            _drain(reader, received)
+            if len(received) > size:
+                last = time.monotonic()
+                if first is None:
+                    first = last
+            time.sleep(min(delay, 0.01) if delay is not None else 0.01)
+        os.close(reader)
+    finally:
+        output.close()
+    assert not os.path.lexists(link)
+    # Сырой режим: байты и концы строк \r\n доходят без изменений
+    assert bytes(received) == expected
+    lines = bytes(received).split(b'\r\n')
+    assert lines[-1] == b'' and all(line.startswith(b'$GP') and b'*' in line for line in lines[:-1])
+    # Скорость линии: не быстрее baud / 10 байт в секунду и без заметных простоев
+    rate = (len(expected) - output._chunk) / (last - first)
+    assert BAUD / BITS_PER_BYTE * 0.8 < rate < BAUD / BITS_PER_BYTE * 1.1
+    assert output.sent == len(expected) and output.errors == 0
@@ -0,0 +1,65 @@
+"""Пакет даты и времени УСВ2 и разбор потока запросов."""
+import time
+import pytest
+import usv2_packet
+from usv2_packet import DateTimeCache, RequestParser, REQUEST, PACKET_SIZE, STATUS_OFFSET, to_bcd
+
+STATUSES = (0x00, 0x80)
+# Местное время: обычная секунда, конец года, 29 февраля и 2000 год (две цифры года 00)
+LOCAL_TIMES = (
+    time.struct_time((2023, 10, 15, 12, 30, 45, 6, 288, 0)),
+    time.struct_time((2016, 12, 31, 23, 59, 59, 5, 366, 0)),
+    time.struct_time((2024, 2, 29, 0, 0, 0, 3, 60, 0)),
+    time.struct_time((2000, 1, 1, 9, 5, 7, 5, 1, 0)),
+)
+
+
+def _baseline_packet(tm, status):
+    # Исходный построитель usv2Server.make_dt_packet: поля через strftime, CRC - сумма байт после заголовка
+    fields = [int(time.strftime(fmt, tm)) for fmt in ("%y", "%m", "%d", "%H", "%M", "%S")]
+    data = b'\x73\x0A' + bytes(to_bcd(field) for field in fields) + b'\x00\x00' + bytes((status,))
+    return data + bytes((sum(data[2:]) & 0xFF,))
+
+
+@pytest.mark.parametrize("tm", LOCAL_TIMES)
+def test_cached_packet_matches_baseline(monkeypatch, tm):
+    monkeypatch.setattr(usv2_packet.time, "localtime", lambda second=None: tm)
+    cache = DateTimeCache()
+    for status in STATUSES:
+        packet = cache.get(status, now=1000.5)
+        assert packet == _baseline_packet(tm, status)
+        assert len(packet) == PACKET_SIZE and packet[STATUS_OFFSET] == status
+        assert packet[11] == sum(packet[2:11]) & 0xFF
+        assert cache.get(status, now=1000.9) is packet
+    # Оба статуса после смены секунды: заготовка и CRC пересчитываются
+    assert cache.get(0x80, now=1001.0) == _baseline_packet(tm, 0x80)
+    assert cache.get(0x00, now=1001.0) == _baseline_packet(tm, 0x00)
+
+
+def test_pipelined_burst():
+    parser = RequestParser()
+    assert parser.feed(REQUEST) == 1
+    assert parser.feed(REQUEST * 50) == 50
+    assert parser.stray == 0
+
+
+def test_split_frame(monkeypatch):
+    # Кадр из нескольких байт (команда и два байта параметра) приходит частями
+    monkeypatch.setitem(usv2_packet.REQUEST_SIZES, 0x74, 3)
+    parser = RequestParser()
+    assert parser.feed(REQUEST + b'\x74\x01') == 1
+    assert parser.feed(b'\x02' + REQUEST) == 2
+    assert parser.feed(b'\x74') == 0
+    assert parser.feed(b'\x01') == 0
+    assert parser.feed(b'\x02') == 1
+    assert parser.stray == 0
+
+
+def test_garbage_between_requests():
+    parser = RequestParser()
+    assert parser.feed(b'\x00' + REQUEST + b'\xff' + REQUEST * 2 + b'\r\n') == 3
+    assert parser.stray == 4
+    # Счетчик накапливается между вызовами, мусор не остается в буфере
+    assert parser.feed(b'xx') == 0
+    assert parser.feed(REQUEST) == 1
+    assert parser.stray == 6
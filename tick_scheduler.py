@@ -0,0 +1,139 @@
+import argparse
+import math
+import threading
+import time
+from metrics import key
+
+MAX_RATE = 50  # Hz
+LATE_FRACTION = 0.5  # тик опоздал, если отправлен позже половины периода
+TICK_LATENESS = key("nmea_tick_lateness_seconds")
+
+
+def parse_rate(value):
+    """Тип аргумента --rate для argparse: частота выдачи в Гц (0 < rate <= MAX_RATE)."""
+    try:
+        rate = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rate: {value}")
+    if not 0 < rate <= MAX_RATE:
+        raise argparse.ArgumentTypeError(f"rate must be in (0, {MAX_RATE}] Hz")
+    return rate
+
+
+class TickScheduler:
+    """Единый планировщик тиков на монотонных часах.
+
+    Тик с номером n приходится на астрономическое время n / rate, поэтому
+    все отправки выровнены по абсолютным границам (для 10 Гц: .000, .100, ...)
+    и не накапливают дрейф. Если цикл не успевает, пропущенные тики не
+    догоняются пачкой, а учитываются в статистике. Новая частота
+    (set_rate) применяется самим циклом тиков со следующего тика; тик -
+    кортеж (номер, частота, время), поэтому его время не меняется при смене
+    частоты, даже если поток клиента читает его позже.
+
+    clock - clock.Clock: время тика переводится в модельное один раз, когда
+    тик наступает, и общее для всех клиентов; без clock - время системы.
+    """
+
+    def __init__(self, rate=1.0, stats=None, clock=None):
+        self.rate = rate
+        self._stats = stats  # metrics.Shard для гистограммы опозданий
+        self.clock = clock
+        self.interval = 1 / rate
+        # Привязка монотонных часов к UTC фиксируется один раз при старте
+        self._offset = time.time() - time.monotonic()
+        self._tick = math.floor((time.monotonic() + self._offset) * rate)
+        self._cond = threading.Condition()
+        self._current = None
+        self._new_rate = None
+        self.ticks = 0
+        self.late_ticks = 0
+        self.skipped_ticks = 0
+        self._lateness = []
+
+    @property
+    def target_rate(self):
+        """Частота, действующая со следующего тика."""
+        return self._new_rate or self.rate
+
+    def timestamp(self, tick):
+        """Время UTC (сек от эпохи), соответствующее тику."""
+        return tick[2]
+
+    def real(self, tick):
+        """Реальное время тика (сек от эпохи): растет от тика к тику, даже если модельное время идет назад."""
+        return tick[0] / tick[1]
+
+    def set_rate(self, rate):
+        """Смена частоты без перезапуска; вызывается из любого потока."""
+        self._new_rate = rate
+
+    def _apply_rate(self):
+        rate, self._new_rate = self._new_rate, None
+        self.rate = rate
+        self.interval = 1 / rate
+        # Номера тиков пересчитываются в новых единицах: следующий тик - ближайшая граница 1 / rate
+        self._tick = math.floor((time.monotonic() + self._offset) * rate)
+
+    def _next(self):
+        if self._new_rate is not None:
+            self._apply_rate()
+        tick = self._tick + 1
+        latest = math.floor((time.monotonic() + self._offset) * self.rate)
+        if latest > tick:
+            self.skipped_ticks += latest - tick
+            tick = latest
+        self._tick = tick
+        real = tick / self.rate
+        timestamp = real if self.clock is None else self.clock.at(real)
+        return (tick, self.rate, timestamp), real - self._offset
+
+    def _record(self, deadline):
+        lateness = max(time.monotonic() - deadline, 0)
+        self.ticks += 1
+        if lateness > self.interval * LATE_FRACTION:
+            self.late_ticks += 1
+        self._lateness.append(lateness)
+        if self._stats is not None:
+            self._stats.observe(TICK_LATENESS, lateness)
+
+    def sleep(self):
+        """Блокирующее ожидание следующего тика, возвращает его номер."""
+        tick, deadline = self._next()
+        time.sleep(max(deadline - time.monotonic(), 0))
+        self._record(deadline)
+        return tick
+
+    async def sleep_async(self):
+        # asyncio нужен только движку async и уже загружен им; движок thread его не импортирует
+        import asyncio
+        tick, deadline = self._next()
+        await asyncio.sleep(max(deadline - time.monotonic(), 0))
+        self._record(deadline)
+        return tick
+
+    def run(self):
+        """Цикл тиков для потокового движка: будит всех ожидающих в wait()."""
+        while True:
+            tick = self.sleep()
+            with self._cond:
+                self._current = tick
+                self._cond.notify_all()
+
+    def wait(self, last_tick=None, timeout=None):
+        """Ожидание в потоке клиента тика, следующего за last_tick; по истечении timeout возвращается last_tick."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._current != last_tick, timeout)
+            return self._current
+
+    def report(self):
+        """Статистика тиков; окно для перцентилей опоздания сбрасывается."""
+        lateness, self._lateness = sorted(self._lateness), []
+        if lateness:
+            p50 = lateness[len(lateness) // 2] * 1000
+            p99 = lateness[min(int(len(lateness) * 0.99), len(lateness) - 1)] * 1000
+            peak = lateness[-1] * 1000
+        else:
+            p50 = p99 = peak = 0.0
+        return (f"Ticks at {self.rate:g} Hz: {self.ticks}, late {self.late_ticks}, skipped {self.skipped_ticks}, "
+                f"jitter p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {peak:.2f} ms")
@@ -0,0 +1,131 @@
+import math
+import numpy as np
+from nmea_sentence import make_fix
+
+EARTH_RADIUS_NM = 3440.065
+GREAT_CIRCLE = "gc"
+RHUMB = "rhumb"
+LEGS = (GREAT_CIRCLE, RHUMB)
+DEFAULT_SPEED = 12.0  # узлы
+DEFAULT_TURN_RATE = 3.0  # град/с
+ARRIVAL_RADIUS = 0.1  # морские мили
+DEFAULT_CENTER = (49.274167, -123.185333)  # неподвижная позиция RMC по умолчанию, 4916.45 N 12311.12 W
+
+
+def load_route(path):
+    """Чтение маршрута: строки "широта долгота" в градусах, # - комментарий."""
+    route = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].replace(',', ' ').split()
+            if line:
+                route.append((float(line[0]), float(line[1])))
+    if len(route) < 2:
+        raise ValueError(f"Route {path} must contain at least 2 waypoints")
+    return route
+
+
+class Fleet:
+    """Модель движения множества судов по замкнутым маршрутам из путевых точек.
+
+    Состояние всех судов хранится в массивах NumPy и обновляется одним
+    векторным шагом на тик: курс поворачивает к текущей путевой точке не
+    быстрее turn_rate, позиция смещается по ортодромии (gc) или локсодромии
+    (rhumb). Поля RMC форматируются лениво, только для судов с клиентами.
+    """
+
+    def __init__(self, routes, speed=DEFAULT_SPEED, turn_rate=DEFAULT_TURN_RATE, leg=GREAT_CIRCLE,
+                 arrival=ARRIVAL_RADIUS):
+        routes = np.radians(np.asarray(routes, dtype=float))  # (суда, точки, [широта, долгота])
+        self.n = routes.shape[0]
+        self.leg = leg
+        self._routes = routes
+        self._index = np.arange(self.n)
+        self._target = np.ones(self.n, dtype=int)
+        self.lat = routes[:, 0, 0].copy()
+        self.lon = routes[:, 0, 1].copy()
+        self.sog = np.full(self.n, float(speed))
+        self.turn_rate = np.radians(np.full(self.n, float(turn_rate)))
+        # Радиус прибытия не меньше радиуса циркуляции, иначе судно будет кружить вокруг точки
+        self._arrival = np.maximum(arrival, self.sog / 3600 / self.turn_rate) / EARTH_RADIUS_NM
+        self.cog = self._bearing(self.lat, self.lon, routes[:, 1, 0], routes[:, 1, 1])
+        self._time = None
+        self._update_fixes()
+
+    @classmethod
+    def around(cls, n, lat, lon, radius=5.0, waypoints=4, seed=None, **kwargs):
+        """n судов на случайных маршрутах в круге radius миль вокруг точки."""
+        rng = np.random.default_rng(seed)
+        distance = radius * np.sqrt(rng.random((n, waypoints)))
+        bearing = rng.random((n, waypoints)) * 2 * math.pi
+        dlat = distance * np.cos(bearing) / 60
+        dlon = distance * np.sin(bearing) / 60 / math.cos(math.radians(lat))
+        return cls(np.stack([lat + dlat, lon + dlon], axis=-1), **kwargs)
+
+    @classmethod
+    def from_route(cls, n, route, **kwargs):
+        """n судов на одном маршруте, стартующих с разных путевых точек."""
+        route = np.asarray(route, dtype=float)
+        return cls(np.stack([np.roll(route, -i, axis=0) for i in range(n)]), **kwargs)
+
+    def _bearing(self, lat1, lon1, lat2, lon2):
+        dlon = (lon2 - lon1 + math.pi) % (2 * math.pi) - math.pi
+        if self.leg == RHUMB:
+            dpsi = np.log(np.tan(math.pi / 4 + lat2 / 2) / np.tan(math.pi / 4 + lat1 / 2))
+            return np.arctan2(dlon, dpsi) % (2 * math.pi)
+        y = np.sin(dlon) * np.cos(lat2)
+        x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+        return np.arctan2(y, x) % (2 * math.pi)
+
+    def _move(self, distance):
+        lat, lon, cog = self.lat, self.lon, self.cog
+        if self.leg == RHUMB:
+            lat2 = lat + distance * np.cos(cog)
+            dpsi = np.log(np.tan(math.pi / 4 + lat2 / 2) / np.tan(math.pi / 4 + lat / 2))
+            q = np.where(np.abs(dpsi) > 1e-12, (lat2 - lat) / np.where(dpsi == 0, 1, dpsi), np.cos(lat))
+            lon2 = lon + distance * np.sin(cog) / q
+        else:
+            lat2 = np.arcsin(np.sin(lat) * np.cos(distance) + np.cos(lat) * np.sin(distance) * np.cos(cog))
+            lon2 = lon + np.arctan2(np.sin(cog) * np.sin(distance) * np.cos(lat),
+                                    np.cos(distance) - np.sin(lat) * np.sin(lat2))
+        self.lat = lat2
+        self.lon = (lon2 + math.pi) % (2 * math.pi) - math.pi
+
+    def step(self, timestamp):
+        """Векторный шаг модели до момента timestamp (сек) для всех судов сразу."""
+        if self._time is None:
+            self._time = timestamp
+            return
+        if timestamp <= self._time:
+            # Опоздавший вызов с прошлым временем не откатывает модель: иначе следующий шаг прошел бы два интервала
+            return
+        dt = timestamp - self._time
+        self._time = timestamp
+        target_lat = self._routes[self._index, self._target, 0]
+        target_lon = self._routes[self._index, self._target, 1]
+        bearing = self._bearing(self.lat, self.lon, target_lat, target_lon)
+        turn = (bearing - self.cog + math.pi) % (2 * math.pi) - math.pi
+        limit = self.turn_rate * dt
+        self.cog = (self.cog + np.clip(turn, -limit, limit)) % (2 * math.pi)
+        self._move(self.sog * dt / 3600 / EARTH_RADIUS_NM)
+        # Гаверсинус: расстояние до путевой точки, по прибытии - следующая точка маршрута
+        a = (np.sin((target_lat - self.lat) / 2) ** 2 +
+             np.cos(self.lat) * np.cos(target_lat) * np.sin((target_lon - self.lon) / 2) ** 2)
+        arrived = 2 * np.arcsin(np.sqrt(np.minimum(a, 1))) < self._arrival
+        self._target = np.where(arrived, (self._target + 1) % self._routes.shape[1], self._target)
+        self._update_fixes()
+
+    def _update_fixes(self):
+        self._lat_deg = np.degrees(self.lat).tolist()
+        self._lon_deg = np.degrees(self.lon).tolist()
+        self._sog_list = self.sog.tolist()
+        self._cog_deg = np.degrees(self.cog).tolist()
+        self._fixes = [None] * self.n
+
+    def fix(self, vessel):
+        """Поля RMC судна (широта, N/S, долгота, E/W, SOG, COG) в байтах на текущий тик."""
+        fix = self._fixes[vessel]
+        if fix is None:
+            fix = self._fixes[vessel] = make_fix(self._lat_deg[vessel], self._lon_deg[vessel],
+                                                 self._sog_list[vessel], self._cog_deg[vessel])
+        return fix
@@ -0,0 +1,65 @@
+import argparse
+import logging
+import socket
+from send_queue import HAS_SENDMSG, join_buffers
+
+# Общий логгер сервиса, обработчики настраивает setup_logger() в скрипте сервера
+logger = logging.getLogger("config_log")
+
+DEFAULT_UDP_PORT = 10110  # стандартный порт NMEA 0183 поверх UDP
+BROADCAST = "broadcast"
+ERROR_LOG_EVERY = 1000  # не засорять лог при недоступном адресате
+
+
+def parse_destination(value):
+    """Адресат UDP "host[:port]": broadcast, адрес multicast-группы или unicast-адрес."""
+    import ipaddress  # только при разборе --udp и профилей с "udp"
+    host, _, port = value.rpartition(':') if ':' in value else (value, '', '')
+    if host.lower() == BROADCAST:
+        host = "255.255.255.255"
+    try:
+        ipaddress.ip_address(host)
+        port = int(port) if port else DEFAULT_UDP_PORT
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid UDP destination: {value}")
+    return host, port
+
+
+class UDPOutput:
+    """Вывод NMEA по UDP: broadcast, multicast-группа или список unicast-адресатов.
+
+    Пакет тика (кортеж буферов) отправляется одним sendmsg на адресата без
+    склейки в один bytes, поэтому стоимость
+    рассылки зависит от числа групп, а не от числа слушателей в сети.
+    """
+
+    def __init__(self, destinations, ttl=1):
+        self.destinations = destinations
+        self.sent = 0
+        self.errors = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+
+    def send(self, buffers):
+        if not HAS_SENDMSG:
+            buffers = (join_buffers(buffers),)
+        for destination in self.destinations:
+            try:
+                if HAS_SENDMSG:
+                    self._sock.sendmsg(buffers, (), 0, destination)
+                else:
+                    self._sock.sendto(buffers[0], destination)
+                self.sent += 1
+            except OSError as e:
+                self.errors += 1
+                if self.errors % ERROR_LOG_EVERY == 1:
+                    logger.warning(f"UDP send to {destination[0]}:{destination[1]} failed ({e}), errors {self.errors}")
+
+    def close(self):
+        self._sock.close()
+
+    def __str__(self):
+        destinations = " ".join(f"[{host}:{port}]" for host, port in self.destinations)
+        return f"UDP {destinations}: sent {self.sent}, errors {self.errors}"
@@ -1,6 +1,6 @@
 #!/usr/bin/python3
 import argparse
-import datetime
+import logging
 import socket
 import sys
 import os
@@ -8,33 +8,45 @@ import time
 import threading
 import select
 import signal
-from config_log import setup_logger
-
-logger = setup_logger("usv2srv.log")
-
-try:
-    import keyboard
-except ImportError as e:
-    logger.error(e)
-
+import multiprocessing
+from config_log import setup_logger, traffic_log, TrafficData, TRAFFIC_LOG_LIMIT
+from usv2_packet import DateTimeCache, RequestParser
+from capture import CaptureWriter, Replay, TX, RX, parse_speed
+from metrics import Metrics, MetricsServer, USV2_DISCONNECTS, count_requests
+from control import USV2Control, ControlServer
+from faults import FaultProfile, parse_usv2_faults, parse_fraction
+from clock import add_clock_arguments, create_clock
+from connections import ConnectionTable, raise_file_limit
+
+# Обработчики логгера настраивает main(): импорт модуля не создает файл лога
+logger = logging.getLogger("config_log")
+keyboard = None  # импортируется в keyhandler() только при интерактивном запуске
 
 IS_WIN = sys.platform.startswith("win") or (sys.platform == "cli" and os.name == "nt")
 DEFAULT_PORT = 5008
 
 
-class ClientSet(set):
-    def __str__(self):
-        return " ".join(f"[{v[0]}:{v[1]}]" for v in self)
-
-
 class USV2Server(threading.Thread):
     
-    def __init__(self, host='', port=DEFAULT_PORT, clients=20, *args, **kwargs):
+    def __init__(self, host='', port=DEFAULT_PORT, clients=20, reuse_port=False, capture=None, metrics=None,
+                 faults=None, clock=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._host = host
         self._port = port
         self._clients = clients
+        self._reuse_port = reuse_port
+        # Статус часов 0x00/0x80 общий для всех клиентов, в разделяемой памяти - и для всех рабочих процессов
+        self._clock = multiprocessing.RawValue('B', 0x00)
+        self.control = USV2Control(self._clock)
+        self._capture = capture
+        self._faults = faults
+        USV2Client._cache.clock = clock
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.register("usv2_clients", lambda: len(USV2Client._clients))
 
+    def toggle_clock_status(self):
+        self._clock.value ^= 0x80
+        logger.info(f"New status clock 0x{self._clock.value:02X}")
 
 
     def run(self):
@@ -44,6 +56,9 @@ class USV2Server(threading.Thread):
                 # не дожидаясь истечения его естественного тайм-аута.
                 logger.info(f"Starting USV2 Server on port {self._port}...")
                 sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self._reuse_port:
+                    # Порт делят рабочие процессы, ядро распределяет между ними подключения
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
                 sock.bind((self._host, self._port))
                 sock.listen(self._clients)
                 sock.setblocking(True)
@@ -60,36 +75,47 @@ class USV2Server(threading.Thread):
                                         daemon=True,
                                         conn=conn, 
                                         addr=addr,
+                                        clock=self._clock,
+                                        capture=self._capture,
+                                        metrics=self.metrics,
+                                        faults=self._faults,
                                         )
                     client.start()
 
 
 class USV2Client(threading.Thread):
-    _clients = ClientSet()
+    _clients = ConnectionTable()  # потоки клиентов, подключение и отключение за O(1)
+    _cache = DateTimeCache()  # общий для всех потоков: BCD и CRC считаются раз в секунду
 
-    def __init__(self, conn=None, addr=None, *args, **kwargs):
+    def __init__(self, conn=None, addr=None, clock=None, capture=None, metrics=None, faults=None,
+                 *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._conn = conn
-        self._addr = addr
         self._ip, self._port = addr
         self._err = ""
-        self._status_clock = b'\x00'
-        self._lock = threading.RLock()
-        
-        USV2Client._add_client(addr)
+        self._clock = clock if clock is not None else multiprocessing.RawValue('B', 0x00)
+        self._parser = RequestParser()  # буфер неполного кадра между recv
+        self._capture = capture
+        self._capture_conn = capture.connection() if capture else 0
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._stats = self._metrics.shard()  # пишет только поток клиента
+        # faults.FaultProfile сервера: у клиента свой генератор искажений или None для чистых ответов
+        self._faults = faults.injector(self._stats) if faults else None
+        self.slot = -1  # индекс в таблице подключений
+        USV2Client._add_client(self)
         logger.info(USV2Client._get_total_clients())
 
     @classmethod
-    def _add_client(cls, addr):
-        cls._clients.add(addr)
+    def _add_client(cls, client):
+        cls._clients.add(client)
 
     @classmethod
-    def _del_client(cls, addr):
-        cls._clients.discard(addr)
+    def _del_client(cls, client):
+        cls._clients.remove(client)
 
     @classmethod
     def _get_total_clients(cls):
-        return f"Total clients: {len(cls._clients)} {cls._clients}"
+        return str(cls._clients)
 
 
     def bytes2str(self, input_data, ascii=False):
@@ -99,67 +125,32 @@ class USV2Client(threading.Thread):
 
             if not is_bytes and not is_byte_list:
                 raise Exception("Входные данные не являются байт строкой/массив")
-            s = ""
             if ascii:
-                input_data = input_data.decode("ascii")
-            for byte in input_data:
-                if ascii:
-                    s += f"{byte}"
-                else:
-                    s += f"_{byte:02X}"
-            return s.lstrip('_')
+                return input_data.decode("ascii")
+            return input_data.hex('_').upper()
         except Exception as e:
             logger.error(e, exc_info=True)
             
-            
-    def toggle_clock_status(self):
-        with self._lock: # Исключаем гонку потоков. 
-            self._status_clock = b'\x80' if self._status_clock == b'\x00' else b'\x00'
-            print(f"New status clock \"{self._status_clock}\" for ({self._addr})")
 
 
-    def to_bcd(self, num: int) -> int:
-    # """Конвертирует число в BCD-формат (например, 23 → 0x23)."""
-        return ((num // 10) << 4) | (num % 10)
-    
-    
-    def _get_date_time_now(self):
-        dt = datetime.datetime.now()
-        YY = dt.strftime("%y")  # Год (23)
-        MM = dt.strftime("%m")  # Месяц (10)
-        DD = dt.strftime("%d")  # День (15)
-        hh = dt.strftime("%H")  # Часы (12)
-        mm = dt.strftime("%M")  # Минуты (30)
-        ss = dt.strftime("%S")  # Секунды (45)
-        dt_bcd_bytes = bytes([
-            self.to_bcd(int(YY)),  # 23 → 0x23
-            self.to_bcd(int(MM)),  # 10 → 0x10
-            self.to_bcd(int(DD)),  # 15 → 0x15
-            self.to_bcd(int(hh)),  # 12 → 0x12
-            self.to_bcd(int(mm)),  # 30 → 0x30
-            self.to_bcd(int(ss))   # 45 → 0x45
-        ])
-        return dt_bcd_bytes 
-       
-    def _calc_crc(self, data):
-        crc = sum(data[2:]) & 0xFF
-        return bytes([crc])
-         
-    def _send_dt_packet(self):
+    def _send_dt_packet(self, count=1):
         try:
-            tx = self.make_dt_packet()
-            self._conn.send(tx)
-            logger.info(f"{self._ip}:{self._port} <- TX: {self.bytes2str(tx)}")
+            # Ответы на все запросы пачки одной записью
+            tx = self.make_dt_packet() * count
+            if self._faults is not None:
+                tx = self._faults.usv2(tx)
+                if not tx:  # ответ задержан до следующего запроса
+                    return
+            self._conn.sendall(tx)
+            if self._capture:
+                self._capture.write(self._capture_conn, TX, tx)
+            traffic_log.log(logging.INFO, "%s:%s <- TX: %s", self._ip, self._port, TrafficData(tx, hex=True))
         except Exception as e:
             logger.error(e, exc_info=True)
 
     def make_dt_packet(self):
-        # self._conn.send(b'\x73\x0A\x14\x03\x31\x13\x41\x05\x00\x00\x00\x21')
-        dtb = self._get_date_time_now()
-        data = b'\x73\x0A' + dtb + b'\x00\x00' + self._status_clock
-        crc = self._calc_crc(data)
-        tx = data + crc
-        return tx
+        # b'\x73\x0A\x14\x03\x31\x13\x41\x05\x00\x00\x00\x21'
+        return USV2Client._cache.get(self._clock.value)
       
             
     def run(self):
@@ -167,11 +158,17 @@ class USV2Client(threading.Thread):
             while True:
                 # метод блокирующий, а это значит что к if not tmp перейдет только после того, как клиент отвалится и вернется 0 байт
                 rx = self._conn.recv(1024)
-                logger.info(f"{self._ip}:{self._port} -> RX: {self.bytes2str(rx)}")
+                start = time.perf_counter()
+                traffic_log.log(logging.INFO, "%s:%s -> RX: %s", self._ip, self._port, TrafficData(rx, hex=True))
                 if not rx:
                     break
-                if b's' in rx: # 0x73 = s
-                    self._send_dt_packet()    
+                if self._capture:
+                    self._capture.write(self._capture_conn, RX, rx)
+                stray = self._parser.stray
+                count = self._parser.feed(rx)  # 0x73 = s
+                if count:
+                    self._send_dt_packet(count)
+                count_requests(self._stats, count, self._parser.stray - stray, start)
         except Exception as e:
             self._err = e
         finally:
@@ -179,10 +176,12 @@ class USV2Client(threading.Thread):
 
 
     def _close(self):
-        msg = f"Client [{self._ip}:{self._port}] connection closed ({self._err})"
+        msg = f"Client [{self._ip}:{self._port}] connection closed ({self._err}), stray bytes {self._parser.stray}"
         logger.info(msg)
         self._conn.close()
-        USV2Client._del_client(self._addr)
+        self._stats.counters[USV2_DISCONNECTS["error" if self._err else "closed"]] += 1
+        self._metrics.retire(self._stats)
+        USV2Client._del_client(self)
         logger.info(USV2Client._get_total_clients())
         # Close thread
         sys.exit()
@@ -191,6 +190,27 @@ class USV2Client(threading.Thread):
 def create_parser():
     parser = argparse.ArgumentParser(description="USV2 protocol emulation")
     parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help='Port to run the server on')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Worker processes sharing the port through SO_REUSEPORT')
+    parser.add_argument('-e', '--engine', choices=["async", "thread"], default="async",
+                        help='Server engine: single event loop for all clients or thread per client')
+    parser.add_argument('--log-traffic', type=int, default=TRAFFIC_LOG_LIMIT,
+                        help='Max TX/RX trace records per second, 0 disables tracing')
+    parser.add_argument('--capture', help='Record all client traffic to a binary capture file')
+    parser.add_argument('--replay', help='Answer requests with replies from a binary capture (async engine only)')
+    parser.add_argument('--replay-speed', type=parse_speed, default=1.0,
+                        help='Replay speed factor, 0 for maximum speed (next recorded reply per request)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve Prometheus metrics on /metrics and JSON on /metrics.json at this HTTP port')
+    parser.add_argument('--control-port', type=int,
+                        help='Serve the runtime control API (GET/POST /state) on this localhost HTTP port')
+    parser.add_argument('--faults', type=parse_usv2_faults,
+                        help='Inject faults with per-reply probabilities, e.g. bcd=0.01,crc=0.01,truncate=0.01,'
+                             'duplicate=0.01,delay=0.01')
+    parser.add_argument('--fault-seed', type=int, help='Seed of the fault injector (default: random, logged)')
+    parser.add_argument('--fault-clients', type=parse_fraction, default=1.0,
+                        help='Fraction of clients that receive faults, the rest get clean replies')
+    add_clock_arguments(parser)
     return parser
 
 
@@ -201,32 +221,80 @@ def exit_gracefully(signal, frame):
 signal.signal(signal.SIGINT, exit_gracefully)
 
 
-def toggle_clock_status():
-    thread_list = [thread for thread in threading.enumerate() if thread.name.startswith('USV2Client')]
-    if thread_list:
-        for thr in thread_list:
-            thr.toggle_clock_status()
+def is_interactive():
+    """Запуск из терминала: демону (systemd, CI) горячие клавиши и модуль keyboard не нужны."""
+    return os.getppid() != 1 and sys.stdin is not None and sys.stdin.isatty()
+
 
-def keyhandler():
+def keyhandler(callback):
+    global keyboard
     try:
-        keyboard.add_hotkey('space', toggle_clock_status)
+        import keyboard
+    except ImportError as e:
+        logger.error(e)
+        return
+    try:
+        keyboard.add_hotkey('space', callback)
     except ImportError:
         logger.warning("Module keyboard work only for root user!")
 
-if __name__ == '__main__':
-    if os.getppid() != 1:  # если запущен не как демон
-        print('Press ESC to exit' if IS_WIN else 'Press CTRL+C to exit')
-        print('Press hotkey Space to change status clock USV2')
-        keyhandler()
+
+def create_server(args):
+    if args.workers > 1 and args.capture:
+        raise ValueError("Capture is not supported with --workers")
+    if args.workers > 1 and args.metrics_port:
+        # Порт метрик занял бы только один рабочий процесс
+        raise ValueError("Metrics endpoint is not supported with --workers")
+    if args.replay and args.engine != "async":
+        raise ValueError("Replay (--replay) is served by the async engine only")
+    capture = CaptureWriter(args.capture) if args.capture else None
+    faults = None
+    if args.faults:
+        faults = FaultProfile(args.faults, args.fault_seed, args.fault_clients, family="usv2_faults_total")
+        logger.info(faults)
+    clock = create_clock(args)
+    if clock is not None:
+        logger.info(clock)
+    if args.engine == "async":
+        from asyncUsv2Server import AsyncUSV2Server
+        replay = Replay(args.replay, args.replay_speed) if args.replay else None
+        server = AsyncUSV2Server(name="USV2Server", daemon=True, port=args.port, reuse_port=args.workers > 1,
+                                 capture=capture, replay=replay, faults=faults, clock=clock)
+    else:
+        server = USV2Server(name="USV2Server", daemon=True, port=args.port, reuse_port=args.workers > 1,
+                            capture=capture, faults=faults, clock=clock)
+    return server, server.toggle_clock_status
+
+
+def main():
     args = create_parser().parse_args()
+    setup_logger("usv2srv.log")
+    traffic_log.limit = args.log_traffic
+    raise_file_limit()  # каждое подключение - дескриптор
     try:
-        server = USV2Server(name="USV2Server", port=args.port, daemon=True)
+        server, toggle = create_server(args)
+        if args.metrics_port:
+            MetricsServer(server.metrics, args.metrics_port, name="MetricsServer", daemon=True).start()
+        if args.control_port:
+            # Флаг часов в разделяемой памяти: API в основном процессе действует и на рабочие процессы
+            ControlServer(server.control, args.control_port, name="ControlServer", daemon=True).start()
+        if args.workers > 1:
+            from workers import WorkerPool
+            server = WorkerPool(args.workers, server.run, name="USV2Workers", daemon=True)
+        if is_interactive():
+            print('Press ESC to exit' if IS_WIN else 'Press CTRL+C to exit')
+            print('Press hotkey Space to change status clock USV2')
+            keyhandler(toggle)
         server.start()
         while server.is_alive():
-            if IS_WIN and keyboard.read_key() == "esc": 
+            if IS_WIN and keyboard is not None and keyboard.read_key() == "esc":
                 sys.exit(0)
             time.sleep(0.1)
     except Exception as e:
         logger.error(e, exc_info=True)
     finally:
-        logger.info("USV2 Server stopped!")
\ No newline at end of file
+        logger.info("USV2 Server stopped!")
+
+
+if __name__ == '__main__':
+    main()
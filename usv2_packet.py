@@ -0,0 +1,96 @@
+import threading
+import time
+
+REQUEST = b's'  # 0x73 - запрос даты и времени
+HEADER = b'\x73\x0A'
+PACKET_SIZE = 12
+STATUS_OFFSET = 10  # байт статуса часов 0x00/0x80, за ним CRC
+# Длины кадров запросов по байту команды; прочие байты потока пропускаются
+REQUEST_SIZES = {REQUEST[0]: 1}
+
+
+def to_bcd(num: int) -> int:
+    """Конвертирует число в BCD-формат (например, 23 → 0x23)."""
+    return ((num // 10) << 4) | (num % 10)
+
+
+def calc_crc(data, crc=0):
+    """CRC пакета УСВ2: сумма байт после заголовка по модулю 256."""
+    return (crc + sum(data)) & 0xFF
+
+
+class DateTimeCache:
+    """Пакет даты и времени УСВ2, кэшированный на текущую секунду.
+
+    BCD-поля и CRC без байта статуса считаются один раз в секунду. Ответ
+    на запрос - копия заготовки с подставленным статусом часов и CRC,
+    увеличенным на значение статуса; готовые пакеты для обоих статусов
+    тоже кэшируются до смены секунды.
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock  # clock.Clock; без него - время системы
+        self._lock = threading.Lock()
+        self._second = None
+        self._base = None
+        self._crc = 0
+        self._packets = {}
+
+    def _build(self, second):
+        tm = time.localtime(second)
+        data = bytes([to_bcd(tm.tm_year % 100), to_bcd(tm.tm_mon), to_bcd(tm.tm_mday),
+                      to_bcd(tm.tm_hour), to_bcd(tm.tm_min), to_bcd(tm.tm_sec)]) + b'\x00\x00'
+        self._base = bytearray(HEADER + data + b'\x00\x00')
+        self._crc = calc_crc(data)
+        self._packets = {}
+        self._second = second
+
+    def get(self, status, now=None):
+        if now is None:
+            now = time.time() if self.clock is None else self.clock.now()
+        second = int(now)
+        with self._lock:
+            if second != self._second:
+                self._build(second)
+            packet = self._packets.get(status)
+            if packet is None:
+                self._base[STATUS_OFFSET] = status
+                self._base[STATUS_OFFSET + 1] = calc_crc((status,), self._crc)
+                packet = self._packets[status] = bytes(self._base)
+            return packet
+
+
+class RequestParser:
+    """Инкрементальный разбор потока запросов одного подключения УСВ2.
+
+    TCP не сохраняет границы запросов: несколько запросов приходят одним
+    сегментом, кадр может быть разрезан между сегментами. Неполный кадр
+    остается в буфере до следующего feed(), байты вне кадров
+    отбрасываются и считаются в stray.
+    """
+
+    __slots__ = ("stray", "_buffer")
+
+    def __init__(self):
+        self.stray = 0
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Добавляет принятые байты, возвращает число полных запросов даты и времени."""
+        if data == REQUEST and not self._buffer:
+            return 1
+        buffer = self._buffer
+        buffer += data
+        count = pos = 0
+        while pos < len(buffer):
+            size = REQUEST_SIZES.get(buffer[pos])
+            if size is None:
+                self.stray += 1
+                pos += 1
+            elif pos + size > len(buffer):
+                break
+            else:
+                count += 1
+                pos += size
+        del buffer[:pos]
+        return count
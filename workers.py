@@ -0,0 +1,53 @@
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+
+# Общий логгер сервиса, обработчики настраивает setup_logger() в скрипте сервера
+logger = logging.getLogger("config_log")
+
+RESTART_CHECK_INTERVAL = 1  # sec
+HAS_REUSEPORT = hasattr(socket, "SO_REUSEPORT")
+
+
+def share_statuses(devices):
+    """Статусы RMC устройств в разделяемую память: переключение видно всем рабочим процессам."""
+    values = multiprocessing.RawArray('c', len(devices))
+    for index, device in enumerate(devices):
+        device.share(values, index)
+    return values
+
+
+class WorkerPool(threading.Thread):
+    """Супервизор рабочих процессов сервера.
+
+    Каждый рабочий процесс выполняет target() и слушает тот же порт через
+    SO_REUSEPORT, ядро распределяет подключения между ними. Упавший
+    процесс перезапускается. Процессы порождаются через fork, поэтому
+    объекты в разделяемой памяти, созданные до старта, общие для всех.
+    """
+
+    def __init__(self, workers, target, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not HAS_REUSEPORT:
+            raise RuntimeError("SO_REUSEPORT is not supported on this platform, use a single worker")
+        self._context = multiprocessing.get_context("fork")
+        self._worker_target = target  # не _target: это атрибут threading.Thread
+        self._processes = [None] * workers
+
+    def _spawn(self, number):
+        process = self._context.Process(target=self._worker_target, name=f"{self.name}-{number}", daemon=True)
+        process.start()
+        self._processes[number] = process
+        logger.info(f"Worker {number} started (pid {process.pid})")
+
+    def run(self):
+        for number in range(len(self._processes)):
+            self._spawn(number)
+        while True:
+            time.sleep(RESTART_CHECK_INTERVAL)
+            for number, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.warning(f"Worker {number} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                    self._spawn(number)